@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""Compares the HTTP cache backends on write throughput and size on disk.
+
+Downloads a story through leech's own cache (so running it again doesn't
+fetch everything from the site again), then writes every response that took
+into a fresh cache of each kind, from several threads at once the way the
+chapter fetcher does.
+
+A big XenForo thread is a good test, as it's a lot of large, repetitive HTML:
+
+    $ python benchmarks/cache_backends.py https://forums.spacebattles.com/threads/...
+"""
+
+import logging
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import click
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import leech
+import sites
+import storage
+from ebook.image import get_size_format
+
+logger = logging.getLogger(__name__)
+
+
+def backends():
+    """(label, factory) for each cache worth comparing; factories take a directory"""
+    yield 'sqlite, no WAL, uncompressed', lambda path: storage.LRUSQLiteCache(
+        path / 'cache.sqlite', wal=False, serializer=storage.compressed_serializer('none'))
+    for compression in ('none', 'gzip', 'zstd'):
+        if compression == 'zstd' and storage.cache.zstandard is None:
+            logger.warning("zstandard isn't installed, skipping zstd")
+            continue
+        yield f'sqlite, WAL, {compression}', lambda path, compression=compression: storage.LRUSQLiteCache(
+            path / 'cache.sqlite', serializer=storage.compressed_serializer(compression))
+        yield f'filesystem, {compression}', lambda path, compression=compression: storage.LRUFileCache(
+            path / 'cache', serializer=storage.compressed_serializer(compression))
+
+
+def disk_usage(path):
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+
+def record_responses(url):
+    """Extracts the story at `url`, returning every response it needed"""
+    session = leech.create_session(True)
+    responses = []
+    send = session.send
+
+    def recording_send(request, **kwargs):
+        response = send(request, **kwargs)
+        responses.append(response)
+        return response
+    session.send = recording_send
+
+    site, url = sites.get(url)
+    options, login = leech.create_options(site, '{}', {})
+    leech.open_story(site, url, session, login, options)
+    session.close()
+    return responses
+
+
+def benchmark(responses, threads):
+    """Writes `responses` into each backend, returning (label, seconds, bytes) rows"""
+    results = []
+    for label, factory in backends():
+        with tempfile.TemporaryDirectory() as directory:
+            cache = factory(Path(directory))
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(cache.save_response, responses))
+            elapsed = time.perf_counter() - start
+            cache.close()
+            results.append((label, elapsed, disk_usage(Path(directory))))
+    return results
+
+
+@click.command()
+@click.argument('url')
+@click.option('--threads', default=4, help="How many threads write to the cache at once")
+@click.option('--verbose', '-v', is_flag=True, help="verbose output")
+def run(url, threads, verbose):
+    """Benchmarks the cache backends with the pages from a story."""
+    leech.configure_logging(verbose)
+    responses = [response for response in record_responses(url) if response.ok]
+    body = sum(len(response.content) for response in responses)
+    click.echo(f"{len(responses)} responses, {get_size_format(body)} of bodies, {threads} threads")
+    click.echo()
+    click.echo(f"{'backend':<32} {'writes/s':>10} {'MB/s':>8} {'on disk':>10} {'ratio':>6}")
+    for label, elapsed, size in benchmark(responses, threads):
+        click.echo(
+            f"{label:<32} {len(responses) / elapsed:>10.1f} {body / elapsed / 1_000_000:>8.1f}"
+            f" {get_size_format(size):>10} {body / size:>6.2f}"
+        )
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""Compares how long decoding a story's pages takes, the old way and the new.
+
+Before, pages were decoded with requests' page.text: quick if the headers
+give a charset, but otherwise it's decoded as ISO-8859-1 (for text/html) or
+run through charset detection (for anything else). Now leech works out the
+encoding itself (see sites.page_encoding) and hands the parser the bytes.
+
+Downloads a story through leech's own cache (so running it again doesn't
+fetch everything from the site again), then times both ways on every page
+it took, decoding alone and then parsing too:
+
+    $ python benchmarks/decoding.py https://forums.spacebattles.com/threads/.../reader/
+"""
+
+import logging
+import sys
+import time
+from pathlib import Path
+
+import click
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import leech
+import sites
+from ebook.image import get_size_format
+
+logger = logging.getLogger(__name__)
+
+
+def record_responses(url):
+    """Extracts the story at `url`, returning every response it needed"""
+    session = leech.create_session(True)
+    responses = []
+    send = session.send
+
+    def recording_send(request, **kwargs):
+        response = send(request, **kwargs)
+        responses.append(response)
+        return response
+    session.send = recording_send
+
+    site, url = sites.get(url)
+    options, login = leech.create_options(site, '{}', {})
+    leech.open_story(site, url, session, login, options)
+    session.close()
+    return responses
+
+
+def best_of(repeat, f):
+    """The quickest of `repeat` calls to `f`, in milliseconds, and what it returned"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000, result
+
+
+def before(response):
+    return response.text
+
+
+def after(response):
+    encoding, _ = sites.page_encoding(response)
+    return response.content.decode(encoding, 'replace')
+
+
+@click.command()
+@click.argument('url')
+@click.option('--repeat', default=3, help="How many times to time each page each way")
+@click.option('--parse/--no-parse', default=True, help="Time parsing with lxml, as well as decoding")
+@click.option('--verbose', '-v', is_flag=True, help="verbose output")
+def run(url, repeat, parse, verbose):
+    """Benchmarks decoding the pages from a story."""
+    leech.configure_logging(verbose)
+    responses = [response for response in record_responses(url) if response.ok and 'html' in response.headers.get('Content-Type', '')]
+    click.echo(f"{len(responses)} pages, {get_size_format(sum(len(response.content) for response in responses))}")
+    click.echo()
+    click.echo(f"{'size':>9} {'encoding':<24} {'before ms':>10} {'after ms':>9} {'same':>5}" + (f" {'parse before':>13} {'parse after':>12}" if parse else ''))
+    totals = [0, 0, 0, 0]
+    for response in responses:
+        old_ms, old = best_of(repeat, lambda response=response: before(response))
+        new_ms, new = best_of(repeat, lambda response=response: after(response))
+        encoding, source = sites.page_encoding(response)
+        row = f"{get_size_format(len(response.content)):>9} {f'{encoding} ({source})':<24} {old_ms:>10.2f} {new_ms:>9.2f} {'yes' if old == new else 'no':>5}"
+        totals[0] += old_ms
+        totals[1] += new_ms
+        if parse:
+            old_parse, _ = best_of(repeat, lambda response=response: BeautifulSoup(before(response), 'lxml'))
+            new_parse, _ = best_of(repeat, lambda response=response, encoding=encoding: BeautifulSoup(response.content, 'lxml', from_encoding=encoding))
+            row += f" {old_parse:>13.1f} {new_parse:>12.1f}"
+            totals[2] += old_parse
+            totals[3] += new_parse
+        click.echo(row)
+    click.echo()
+    click.echo(f"decoding: {totals[0]:.1f}ms before, {totals[1]:.1f}ms after")
+    if parse:
+        click.echo(f"decoding and parsing: {totals[2]:.1f}ms before, {totals[3]:.1f}ms after")
+
+
+if __name__ == '__main__':
+    run()
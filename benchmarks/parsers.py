@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""Compares --parser lxml against lxml-native on the time to extract stories.
+
+Downloads each story through leech's own cache first (so running it again
+doesn't fetch everything from the site again), then extracts it from the
+cache alone with each parser, a few times over, keeping the best time. The
+network's out of it entirely, so what's left is parsing, cleaning and
+serializing the chapters.
+
+lxml-native only makes a difference on the sites which support it, and most
+of all on big pages: XenForo reader mode, and AO3 full works.
+
+    $ python benchmarks/parsers.py https://forums.spacebattles.com/threads/.../reader/ https://archiveofourown.org/works/...
+"""
+
+import logging
+import sys
+import time
+from pathlib import Path
+
+import click
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import leech
+import sites
+
+logger = logging.getLogger(__name__)
+
+PARSERS = ('lxml', sites.NATIVE_PARSER)
+
+
+def extract(url, parser, offline=True):
+    """Extracts the story at `url` with `parser`, returning (story, seconds)"""
+    session = leech.create_session(True, offline=offline)
+    site, url = sites.get(url)
+    options, login = leech.create_options(site, '{}', {'parser': parser})
+    start = time.perf_counter()
+    story = leech.open_story(site, url, session, login, options)
+    elapsed = time.perf_counter() - start
+    session.close()
+    return story, elapsed
+
+
+def benchmark(url, repeat):
+    """Times extracting `url` with each parser, returning (parser, best seconds, chapters) rows"""
+    results = []
+    for parser in PARSERS:
+        times = []
+        for _ in range(repeat):
+            story, elapsed = extract(url, parser)
+            times.append(elapsed)
+        results.append((parser, min(times), len(list(story.everychapter()))))
+    return results
+
+
+@click.command()
+@click.argument('urls', nargs=-1, required=True)
+@click.option('--repeat', default=3, help="How many times to extract each story with each parser")
+@click.option('--verbose', '-v', is_flag=True, help="verbose output")
+def run(urls, repeat, verbose):
+    """Benchmarks the parsers on the pages of some stories."""
+    leech.configure_logging(verbose)
+    if not verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    for url in urls:
+        # Makes sure everything's in the cache, for the offline runs
+        extract(url, 'lxml', offline=False)
+        click.echo(url)
+        click.echo(f"  {'parser':<12} {'seconds':>8} {'chapters':>9} {'speed-up':>9}")
+        results = benchmark(url, repeat)
+        baseline = results[0][1]
+        for parser, elapsed, chapters in results:
+            click.echo(f"  {parser:<12} {elapsed:>8.2f} {chapters:>9} {baseline / elapsed:>8.1f}x")
+
+
+if __name__ == '__main__':
+    run()
@@ -1,12 +1,19 @@
-from .epub import make_epub, EpubFile
+from .epub import make_epub, read_epub, EpubFile  # noqa: F401
 from .cover import make_cover, make_cover_from_url
-from .image import get_image_from_url
+from .image import get_image_from_url, make_fallback_image
 
 import html
+import json
+import logging
+import os
+import re
+import requests
 import unicodedata
 import datetime
 from attrs import define, asdict
 
+logger = logging.getLogger(__name__)
+
 html_template = '''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
 <html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
 <head>
@@ -89,16 +96,18 @@ def chapter_html(
     image_options,
     titleprefix=None,
     normalize=False,
-    session=None
+    session=None,
+    offset=0,
+    manifest=None
 ):
     images = {}
     chapters = []
-    for i, chapter in enumerate(story):
+    for i, chapter in enumerate(story, start=offset):
         title = chapter.title or f'#{i}'
         if hasattr(chapter, '__iter__'):
             # This is a Section
             chapters.extend(chapter_html(
-                chapter, image_options=image_options, titleprefix=title, normalize=normalize, session=session
+                chapter, image_options=image_options, titleprefix=title, normalize=normalize, session=session, manifest=manifest
             ))
         else:
             contents = chapter.contents
@@ -121,46 +130,62 @@ def chapter_html(
         images.update(story.footnotes.images)
 
     for image in images.values():
-        img_contents = get_image_from_url(
-            image.url,
-            image_format=image_options.get('image_format'),
-            compress_images=image_options.get('compress_images'),
-            max_image_size=image_options.get('max_image_size'),
-            always_convert=image_options.get('always_convert_images'),
-            session=session
-        )
         path = f'{story.id}/{image.path()}'
         for chapterfile in chapters:
             if chapterfile.path == path:
                 break
         else:
+            contents, filetype = image_contents(image, image_options, session, manifest)
             chapters.append(
-                EpubFile(path=path, contents=img_contents[0], filetype=img_contents[2])
+                EpubFile(path=path, contents=contents, filetype=filetype)
             )
 
     return chapters
 
 
-def generate_epub(story, cover_options={}, image_options={}, output_filename=None, output_dir=None, normalize=False, allow_spaces=False, session=None, parser='lxml'):
-    dates = list(story.dates())
+def image_contents(image, image_options, session=None, manifest=None):
+    """The data and mimetype of an image, converted per `image_options`, and
+    reused from the manifest if it was converted the same way last time"""
+    def convert(fallback=True):
+        return get_image_from_url(
+            image.url,
+            image_format=image_options.get('image_format'),
+            compress_images=image_options.get('compress_images'),
+            max_image_size=image_options.get('max_image_size'),
+            always_convert=image_options.get('always_convert_images'),
+            session=session,
+            fallback=fallback
+        )
+
+    if manifest is None:
+        img_contents = convert()
+        return img_contents[0], img_contents[2]
+
+    options = json.dumps(image_options, sort_keys=True)
+    saved = manifest.image(image.path(), options)
+    if saved:
+        return saved
+    try:
+        img_contents = convert(fallback=False)
+    except Exception as e:
+        # Not saved, so it gets another try next time
+        logger.info("Encountered an error downloading image: " + str(e))
+        return make_fallback_image("There was a problem downloading this image.").read(), "image/jpeg"
+    manifest.record_image(image.path(), image.url, img_contents[0], img_contents[2], options)
+    return img_contents[0], img_contents[2]
+
+
+def story_metadata(story, started, updated):
     metadata = {
         'title': story.title,
         'author': story.author,
         'unique_id': story.url,
-        'started': min(dates),
-        'updated': max(dates),
+        'started': started,
+        'updated': updated,
         'extra': '',
     }
     extra_metadata = {}
 
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:128.0) Gecko/20100101 Firefox/128.0',
-    })
-    if story.url:
-        session.headers.update({
-            'Referer': story.url,
-        })
-
     if story.summary:
         extra_metadata['Summary'] = story.summary
     if story.tags:
@@ -169,12 +194,34 @@ def generate_epub(story, cover_options={}, image_options={}, output_filename=Non
     if extra_metadata:
         metadata['extra'] = '\n        '.join(
             f'<dt>{k}</dt><dd>{v}</dd>' for k, v in extra_metadata.items())
+    return metadata
+
 
+def prepare_session(session, story):
+    # Image hosts can be picky about who's asking
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:128.0) Gecko/20100101 Firefox/128.0',
+    })
+    if story.url:
+        session.headers.update({
+            'Referer': story.url,
+        })
+
+
+def valid_image_options(image_options):
     valid_image_options = ('image_fetch', 'image_format', 'compress_images',
                            'max_image_size', 'always_convert_images')
     image_options = ImageOptions(
         **{k: v for k, v in image_options.items() if k in valid_image_options})
-    image_options = asdict(image_options, filter=lambda k, v: v is not None)
+    return asdict(image_options, filter=lambda k, v: v is not None)
+
+
+def generate_epub(story, cover_options={}, image_options={}, output_filename=None, output_dir=None, normalize=False, allow_spaces=False, session=None, parser='lxml', manifests=None):
+    # Chapters whose date isn't known (e.g. placeholders) don't count
+    dates = [date for date in story.dates() if date] or [datetime.datetime.now()]
+    metadata = story_metadata(story, min(dates), max(dates))
+    prepare_session(session, story)
+    image_options = valid_image_options(image_options)
 
     valid_cover_options = ('fontname', 'fontsize', 'width',
                            'height', 'wrapat', 'bgcolor', 'textcolor', 'cover_url')
@@ -184,13 +231,14 @@ def generate_epub(story, cover_options={}, image_options={}, output_filename=Non
 
     if cover_options and "cover_url" in cover_options:
         image = make_cover_from_url(
-            cover_options["cover_url"], story.title, story.author)
+            cover_options["cover_url"], story.title, story.author, session=session)
     elif story.cover_url:
-        image = make_cover_from_url(story.cover_url, story.title, story.author)
+        image = make_cover_from_url(story.cover_url, story.title, story.author, session=session)
     else:
         image = make_cover(story.title, story.author, **cover_options)
 
-    return make_epub(
+    manifest = manifests.open(story) if manifests else None
+    filename = make_epub(
         output_filename or story.title + '.epub',
         [
             # The cover is static, and the only change comes from the image which we generate
@@ -201,12 +249,12 @@ def generate_epub(story, cover_options={}, image_options={}, output_filename=Non
                 story,
                 image_options=image_options,
                 normalize=normalize,
-                session=session
+                session=session,
+                manifest=manifest
             ),
             EpubFile(
                 path='Styles/base.css',
-                contents=session.get(
-                    'https://raw.githubusercontent.com/mattharrison/epub-css-starter-kit/master/css/base.css').text,
+                contents=stylesheet(session),
                 filetype='text/css'
             ),
             EpubFile(path='images/cover.png',
@@ -216,3 +264,98 @@ def generate_epub(story, cover_options={}, image_options={}, output_filename=Non
         output_dir=output_dir,
         allow_spaces=allow_spaces
     )
+    if manifest:
+        manifest.save()
+    return filename
+
+
+STYLESHEET_URL = 'https://raw.githubusercontent.com/mattharrison/epub-css-starter-kit/master/css/base.css'
+
+
+def stylesheet(session):
+    # e.g. when working offline and it's not in the cache, the ebook's still
+    # readable without it; but it has to have something in it, or make_epub
+    # goes looking for Styles/base.css on disk
+    fallback = '/* The stylesheet couldn\'t be fetched */\n'
+    try:
+        response = session.get(STYLESHEET_URL)
+    except requests.RequestException as e:
+        logger.warning("Couldn't fetch the stylesheet (%s)", e)
+        return fallback
+    if not response.ok:
+        logger.warning("Couldn't fetch the stylesheet (%s %s)", response.status_code, response.reason)
+        return fallback
+    return response.text or fallback
+
+
+# Files which chapter_html wrote for chapters, rather than footnotes / images
+CHAPTER_PATH = re.compile(r'/chapter\d+\.html$')
+
+
+def held_chapters(book):
+    """The chapters in an ebook read by read_epub, in order"""
+    return [file for file in book.files if CHAPTER_PATH.search(file.path)]
+
+
+def update_epub(book, story, image_options={}, normalize=False, session=None, manifests=None):
+    """Adds the chapters in `story` to an ebook read by read_epub, after the
+    chapters it already has, and writes it back to the same file.
+
+    The story's chapters (and footnotes) must have been numbered to follow
+    on from the ebook's; see Site.chapter_offset. Everything already in the
+    ebook is reused as it is, apart from the front matter, which gets the new
+    dates, and the footnotes, which get any new ones added to the end.
+    """
+    held = held_chapters(book)
+    pages = [file for file in book.files if file.filetype == 'application/xhtml+xml']
+    others = [file for file in book.files if file.filetype != 'application/xhtml+xml']
+
+    prepare_session(session, story)
+    manifest = manifests.open(story) if manifests else None
+    new_files = chapter_html(
+        story,
+        image_options=valid_image_options(image_options),
+        normalize=normalize,
+        session=session,
+        offset=len(held),
+        manifest=manifest
+    )
+    new_pages = [file for file in new_files if file.filetype == 'application/xhtml+xml']
+    new_others = [file for file in new_files if file.filetype != 'application/xhtml+xml']
+
+    old_paths = {file.path: i for i, file in enumerate(pages)}
+    for file in list(new_pages):
+        if file.path in old_paths:
+            # The footnotes: keep the ones the ebook already has
+            old_notes = re.search(r'<h1>Footnotes</h1>\n(.*)\n</body>', pages[old_paths[file.path]].contents.decode('utf-8'), re.DOTALL)
+            pages[old_paths[file.path]] = file._replace(contents=html_template.format(
+                title="Footnotes", text=old_notes.group(1) + '\n\n' + story.footnotes.contents))
+            new_pages.remove(file)
+
+    frontmatter = pages.index(next(file for file in pages if file.path == 'frontmatter.html'))
+    old_dates = dict(re.findall(r'<dt>(Started|Updated)</dt>\s*<dd>([\d-]+)</dd>', pages[frontmatter].contents.decode('utf-8')))
+    dates = [date for date in story.dates() if date]
+    metadata = story_metadata(
+        story,
+        datetime.datetime.strptime(old_dates['Started'], '%Y-%m-%d'),
+        max(dates) if dates else datetime.datetime.strptime(old_dates['Updated'], '%Y-%m-%d'),
+    )
+    pages[frontmatter] = pages[frontmatter]._replace(contents=frontmatter_template.format(now=datetime.datetime.now(), **metadata))
+
+    # New chapters go straight after the old ones, ahead of the footnotes
+    after = pages.index(held[-1]) + 1 if held else len(pages)
+    pages[after:after] = new_pages
+    old_others = {file.path for file in others}
+    others.extend(file for file in new_others if file.path not in old_others)
+
+    # Written alongside and then swapped in, so a failure leaves the old one be
+    written = make_epub(
+        f'.leech-update-{os.getpid()}.epub',
+        pages + others,
+        metadata,
+        output_dir=os.path.dirname(book.filename)
+    )
+    os.replace(written, book.filename)
+    if manifest:
+        manifest.save()
+    return book.filename
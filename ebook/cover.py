@@ -33,10 +33,10 @@ def make_cover(title, author, width=600, height=800, fontname="Helvetica", fonts
     return output
 
 
-def make_cover_from_url(url, title, author):
+def make_cover_from_url(url, title, author, session=None):
     try:
         logger.info("Downloading cover from " + url)
-        img = requests.Session().get(url)
+        img = (session or requests.Session()).get(url)
         cover = BytesIO(img.content)
 
         imgformat = Image.open(cover).format
@@ -16,6 +16,14 @@ This totally started from http://www.manuel-strehl.de/dev/simple_epub_ebooks_wit
 
 
 EpubFile = namedtuple('EbookFile', 'path, contents, title, filetype', defaults=(False, False, "application/xhtml+xml"))
+Epub = namedtuple('Epub', 'filename, meta, files')
+
+NAMESPACES = {
+    'container': "urn:oasis:names:tc:opendocument:xmlns:container",
+    'opf': "http://www.idpf.org/2007/opf",
+    'dc': "http://purl.org/dc/elements/1.1/",
+    'ncx': "http://www.daisy.org/z3986/2005/ncx/",
+}
 
 
 def sanitize_filename(s, allow_spaces=False):
@@ -148,5 +156,44 @@ def make_epub(filename, files, meta, compress=True, output_dir=False, allow_spac
     return filename
 
 
+def read_epub(filename):
+    """Read back an epub written by make_epub
+
+    Returns an Epub whose `meta` has the unique_id, title and author, and
+    whose `files` are EpubFiles in their original order, titled from the
+    toc.ncx. Those can be handed straight back to make_epub.
+    """
+    with zipfile.ZipFile(filename) as epub:
+        container = etree.fromstring(epub.read("META-INF/container.xml"))
+        opf_path = container.find('container:rootfiles/container:rootfile', NAMESPACES).get('full-path')
+        root = os.path.dirname(opf_path)
+        package = etree.fromstring(epub.read(opf_path))
+
+        metadata = package.find('opf:metadata', NAMESPACES)
+        meta = {
+            'unique_id': metadata.findtext('dc:identifier', namespaces=NAMESPACES),
+            'title': metadata.findtext('dc:title', namespaces=NAMESPACES),
+            'author': metadata.findtext('dc:creator', namespaces=NAMESPACES),
+        }
+
+        items = package.findall('opf:manifest/opf:item', NAMESPACES)
+        ncx = next(item for item in items if item.get('id') == 'ncx')
+        titles = {}
+        for point in etree.fromstring(epub.read(os.path.join(root, ncx.get('href')))).iter(f'{{{NAMESPACES["ncx"]}}}navPoint'):
+            titles[point.find('ncx:content', NAMESPACES).get('src')] = point.findtext('ncx:navLabel/ncx:text', namespaces=NAMESPACES)
+
+        files = [
+            EpubFile(
+                path=item.get('href'),
+                contents=epub.read(os.path.join(root, item.get('href'))),
+                title=titles.get(item.get('href'), False),
+                filetype=item.get('media-type'),
+            )
+            for item in items if item is not ncx
+        ]
+
+    return Epub(filename, meta, files)
+
+
 if __name__ == '__main__':
     make_epub('test.epub', [EpubFile(title='Chapter 1', path='a.html', contents="Test"), EpubFile(title='Chapter 2', path='test/b.html', contents="Still a test")], {})
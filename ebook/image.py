@@ -87,7 +87,8 @@ def get_image_from_url(
     compress_images: bool = False,
     max_image_size: int = 1_000_000,
     always_convert: bool = False,
-    session: requests.Session = None
+    session: requests.Session = None,
+    fallback: bool = True
 ) -> Tuple[bytes, str, str]:
     """
     Based on make_cover_from_url(), this function takes in the image url usually gotten from the `src` attribute of
@@ -97,6 +98,7 @@ def get_image_from_url(
     @param image_format: The format to convert the image to if it's not in the supported formats
     @param compress_images: Whether to compress the image or not
     @param max_image_size: The maximum size of the image in bytes
+    @param fallback: Whether to return a placeholder image, rather than raise, if something goes wrong
     @return: A tuple of the image data, the image format and the image mime type
     """
     logger.info("Downloading image: %s", url)
@@ -148,6 +150,8 @@ def get_image_from_url(
         return PIL_Image_to_bytes(PIL_image, current_format), current_format, f"image/{current_format.lower()}"
 
     except Exception as e:
+        if not fallback:
+            raise
         logger.info("Encountered an error downloading image: " + str(e))
         image = make_fallback_image("There was a problem downloading this image.").read()
         return image, "jpeg", "image/jpeg"
@@ -1,23 +1,47 @@
 #!/usr/bin/env python3
 
+import asyncio
 import click
+import collections
+import contextlib
+import datetime
 import http.cookiejar
+import http.server
 import json
 import logging
+import multiprocessing.util
 import os
+import queue
+import re
 import requests
 import requests_cache
+import shutil
+import threading
+import time
+import unicodedata
+import urllib.parse
+import uuid
+from attrs import define, Factory
 from click_default_group import DefaultGroup
+from concurrent.futures import ProcessPoolExecutor
 from functools import reduce
 from pathlib import Path
 from platformdirs import PlatformDirs
+from requests_cache.policy.expiration import get_url_expiration
 
 import sites
 import ebook
+import storage
 
 __version__ = 2
 USER_AGENT = 'Leech/%s +http://davidlynch.org' % __version__
 
+# In megabytes; can be set with `cache_max_size` in leech.json
+DEFAULT_CACHE_MAX_SIZE = 1024
+
+# Longest `leech watch` sleeps between looking for due stories, in seconds
+WATCH_IDLE = 300
+
 logger = logging.getLogger(__name__)
 
 dirs = PlatformDirs('Leech', 'davidlynch.org', ensure_exists=True)
@@ -45,14 +69,86 @@ def configure_logging(verbose):
         )
 
 
-def create_session(cache) -> requests_cache.CachedSession | requests.Session:
+def load_config():
+    """Returns the contents of the first leech.json found, or None"""
+    for directory in likely_paths(dirs.user_config_path):
+        if not os.path.exists(directory / 'leech.json'):
+            logger.debug("No leech.json present in %s", directory)
+            continue
+        logger.debug("Loading leech.json from %s", directory)
+        with open(directory / 'leech.json') as store_file:
+            return json.load(store_file)
+    return None
+
+
+def create_cache(config=None):
+    """The persistent HTTP cache, which lives in the user cache directory.
+
+    `cache_backend` in leech.json picks where it's kept: "sqlite" (the
+    default) for a single database file, or "filesystem" for a file per
+    response. `cache_compression` can be "zstd", "gzip" or "none".
+    """
+    config = config if config is not None else (load_config() or {})
+    max_size = int(config.get('cache_max_size', DEFAULT_CACHE_MAX_SIZE)) * 1_000_000
+    try:
+        serializer = storage.compressed_serializer(config.get('cache_compression'))
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    backend = config.get('cache_backend', 'sqlite')
+    if backend == 'sqlite':
+        return storage.LRUSQLiteCache(dirs.user_cache_path / 'http_cache.sqlite', max_size=max_size, serializer=serializer)
+    if backend == 'filesystem':
+        return storage.LRUFileCache(dirs.user_cache_path / 'http_cache', max_size=max_size, serializer=serializer)
+    raise click.UsageError(f"Unknown cache_backend in leech.json: {backend}")
+
+
+def create_manifests(cache):
+    """Where what went into each story's last ebook is kept, so chapters and
+    images which haven't changed since aren't processed again. It goes along
+    with the HTTP cache: --no-cache means building everything afresh."""
+    if cache:
+        return storage.ManifestStore(dirs.user_data_path / 'manifests')
+
+
+def create_checkpoints(cache):
+    """Where chapters are saved as they're extracted, for --resume. Like the
+    manifests, these go along with the HTTP cache."""
+    if cache:
+        return storage.CheckpointStore(dirs.user_data_path / 'checkpoints')
+
+
+def create_library():
+    """The catalog of every ebook built, for `leech library`"""
+    return storage.Library(dirs.user_data_path / 'library.sqlite')
+
+
+def create_session(cache, offline=False) -> requests_cache.CachedSession | requests.Session:
     if cache:
-        session = requests_cache.CachedSession('leech', expire_after=4 * 3600, use_temp=True, backend='sqlite')
+        session = storage.StatsCachedSession(
+            backend=create_cache(),
+            expire_after=4 * 3600,
+            urls_expire_after=sites.cache_policies(),
+        )
         logger.debug("CachedSession at %s", session.cache.db_path)
+        if offline:
+            # Everything comes from the cache, however old; anything that
+            # isn't there is a 504 rather than a request
+            session.settings.only_if_cached = True
+            session.settings.stale_if_error = True
+            logger.info("Working offline, from the cache alone")
     else:
         session = requests.Session()
         logger.debug("Uncached session")
 
+    # Chapters get fetched from a pool of worker threads (see Site._fetch_all).
+    # The session is shared between them: the cache backends serialize their
+    # own access, but the default connection pool only keeps 10 connections per
+    # host and would throw away the extras, so size it to the worker count.
+    # The adapter also applies the per-host rate limits, on cache misses only.
+    adapter = sites.RateLimitedAdapter(pool_maxsize=sites.MAX_CONCURRENCY)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
     lwp_cookiejar = http.cookiejar.LWPCookieJar()
     for directory in likely_paths(dirs.user_data_path):
         if not os.path.exists(directory / 'leech.cookies'):
@@ -75,24 +171,16 @@ def create_session(cache) -> requests_cache.CachedSession | requests.Session:
 
 
 def load_on_disk_options(site):
-    loaded = False
-    for directory in likely_paths(dirs.user_config_path):
-        if not os.path.exists(directory / 'leech.json'):
-            logger.debug("No leech.json present in %s", directory)
-            continue
-        logger.debug("Loading leech.json from %s", directory)
-        with open(directory / 'leech.json') as store_file:
-            store = json.load(store_file)
-            login = store.get('logins', {}).get(site.site_key(), False)
-            cover_options = store.get('cover', {})
-            image_options = store.get('images', {})
-            consolidated_options = {
-                **{k: v for k, v in store.items() if k not in ('cover', 'images', 'logins')},
-                **store.get('site_options', {}).get(site.site_key(), {})
-            }
-        loaded = True
-        break
-    if not loaded:
+    store = load_config()
+    if store is not None:
+        login = store.get('logins', {}).get(site.site_key(), False)
+        cover_options = store.get('cover', {})
+        image_options = store.get('images', {})
+        consolidated_options = {
+            **{k: v for k, v in store.items() if k not in ('cover', 'images', 'logins')},
+            **store.get('site_options', {}).get(site.site_key(), {})
+        }
+    else:
         logger.info("Unable to locate leech.json. Continuing assuming it does not exist.")
         login = False
         image_options = {}
@@ -126,10 +214,13 @@ def create_options(site, site_options, unused_flags):
     return options, login
 
 
-def open_story(site, url, session, login, options):
+def open_story(site, url, session, login, options, chapter_filters=(), manifests=None, checkpoint=None):
     handler = site(
         session,
-        options=options
+        options=options,
+        chapter_filters=list(chapter_filters),
+        manifests=manifests,
+        checkpoint=checkpoint
     )
 
     if login:
@@ -141,12 +232,183 @@ def open_story(site, url, session, login, options):
     except sites.SiteException as e:
         logger.error(e)
         return
-    if not story:
+    # With chapter filters, an empty story just means none of its chapters
+    # were wanted (e.g. an update with nothing new), which isn't a failure
+    if story is None or not (story or chapter_filters):
         logger.error("Couldn't extract story")
         return
     return story
 
 
+async def open_story_async(site, url, session, login, options, chapter_filters=(), manifests=None, checkpoint=None):
+    """Coroutine equivalent of open_story, for embedding leech in an event loop.
+
+    Sites built on sites.AsyncSite extract natively; the rest are run in a
+    worker thread."""
+    handler = site(
+        session,
+        options=options,
+        chapter_filters=list(chapter_filters),
+        manifests=manifests,
+        checkpoint=checkpoint
+    )
+
+    if login:
+        logger.info("Attempting to log in as %s", login[0])
+        await asyncio.to_thread(handler.login, login)
+
+    try:
+        story = await handler.aextract(url)
+    except sites.SiteException as e:
+        logger.error(e)
+        return
+    finally:
+        await handler.aclose()
+    if story is None or not (story or chapter_filters):
+        logger.error("Couldn't extract story")
+        return
+    return story
+
+
+def comparable_titles(titles):
+    return [unicodedata.normalize('NFKC', title or '').strip() for title in titles]
+
+
+class SkipHeldChapters:
+    """A chapter filter for `leech update`: drops the chapters an ebook
+    already has, as long as the story's index still starts with them, and
+    numbers the rest (and their footnotes) to follow on from them.
+    """
+
+    def __init__(self, titles, footnotes=0):
+        self.titles = titles
+        self.footnotes = footnotes
+        # How many chapters were skipped; None if the site never asked
+        self.skipped = None
+
+    def __call__(self, site, links):
+        held = len(self.titles)
+        if comparable_titles(link.title for link in links[:held]) != comparable_titles(self.titles):
+            logger.warning("The chapters have changed since this ebook was made, so fetching all of them")
+            self.skipped = 0
+            return links
+        self.skipped = held
+        site.chapter_offset = held
+        site.footnote_offset = self.footnotes
+        return links[held:]
+
+
+class RecentChapters:
+    """A chapter filter for `download --since` / `--last`: just the chapters
+    posted since a date, or the last so many.
+
+    Sites which list chapter dates in their index are filtered before any
+    chapters are fetched; `trim` catches the rest once they have been.
+    """
+
+    def __init__(self, since=None, last=None):
+        self.since = since
+        self.last = last
+        # Whether the site asked, so the chapters were filtered before fetching
+        self.called = False
+
+    def describe(self):
+        return ', '.join(filter(None, (
+            self.since and f"since {self.since:%Y-%m-%d}",
+            self.last and f"last {self.last}",
+        )))
+
+    def recent(self, date):
+        if not (self.since and date):
+            return True
+        since = self.since
+        if date.tzinfo and not since.tzinfo:
+            since = since.astimezone()
+        elif since.tzinfo and not date.tzinfo:
+            date = date.astimezone()
+        return date >= since
+
+    def __call__(self, site, links):
+        self.called = True
+        links = [link for link in links if self.recent(link.date)]
+        return links[-self.last:] if self.last else links
+
+    def trim(self, story):
+        """Drop the chapters the site didn't let us filter out in advance"""
+        chapters = [chapter for chapter in story.everychapter() if self.recent(chapter.date)]
+        if self.last and not self.called:
+            chapters = chapters[-self.last:]
+        keep = {id(chapter) for chapter in chapters}
+
+        def prune(section):
+            section.contents = [
+                chapter for chapter in section
+                if (prune(chapter) if hasattr(chapter, '__iter__') else id(chapter) in keep)
+            ]
+            return bool(section.contents)
+
+        prune(story)
+
+
+@contextlib.contextmanager
+def revalidating(session):
+    """Has a cached `session` check everything it has cached (bar chapters)
+    with the site before using it, however fresh; the site answers a
+    conditional request with a 304 if the page has a validator, and the page
+    is fetched again if not"""
+    cache = getattr(session, 'cache', None)
+    if cache is None:
+        yield
+        return
+    get_response = cache.get_response
+
+    def expired_response(key, default=None):
+        response = get_response(key, default)
+        if response is not default and get_url_expiration(response.request.url, session.settings.urls_expire_after) != sites.CACHE_CHAPTER:
+            response.expires = datetime.datetime.now(datetime.timezone.utc)
+        return response
+
+    cache.get_response = expired_response
+    try:
+        yield
+    finally:
+        cache.get_response = get_response
+
+
+def index_story(site, url, session, login, options):
+    """The chapters listed in a story's index, as a sites.StoryIndex
+
+    The index is revalidated with the site rather than taken from the cache,
+    which could be hours old, since new chapters are the whole point.
+    """
+    handler = site(session, options=options)
+    if login:
+        logger.info("Attempting to log in as %s", login[0])
+        handler.login(login)
+    with revalidating(session):
+        return handler.index(url)
+
+
+def image_options(options):
+    return {
+        'image_fetch': options.get('image_fetch', True),
+        'image_format': options.get('image_format', 'jpeg'),
+        'compress_images': options.get('compress_images', False),
+        'max_image_size': options.get('max_image_size', 1_000_000),
+        'always_convert_images': options.get('always_convert_images', False)
+    }
+
+
+def close_session(session):
+    if stats := getattr(session, 'cache_stats', None):
+        logger.info(
+            "Cache: %d pages reused, %d revalidated as unchanged (saving %s), %d downloaded",
+            stats.hits, stats.revalidated, ebook.image.get_size_format(stats.saved_bytes), stats.downloaded
+        )
+        session.cache.prune()
+    session.close()
+
+
 def site_specific_options(f):
     option_list = sites.list_site_specific_options()
     return reduce(lambda cmd, decorator: decorator(cmd), [f] + option_list)
@@ -158,19 +420,279 @@ def cli():
     pass
 
 
+def cached_story_responses(session, site, url, options, chapters=True):
+    """Goes through a story from the cache alone, without touching the
+    network, and returns {cache key: response} for every cached page that
+    took.
+
+    With `chapters` the whole story is extracted; otherwise only its index
+    is listed, and the pages of the chapters it lists are left out. Anything
+    which isn't cached stops there, so for a partly cached story this is only
+    the pages up to that point (and, without `chapters`, only those the
+    site's cache policies say are indexes).
+    """
+    used = {}
+    get_response = session.cache.get_response
+
+    def recording_get_response(key, default=None):
+        response = get_response(key, default)
+        if response is not default:
+            used[key] = response
+        return response
+
+    session.cache.get_response = recording_get_response
+    # Expired pages are served as they are; missing ones become 504s
+    session.settings.only_if_cached = True
+    session.settings.stale_if_error = True
+    handler = site(session, options={**options, 'retries': 0, 'image_fetch': chapters and options.get('image_fetch')})
+    listed = None
+    try:
+        if chapters:
+            handler.extract(url)
+        else:
+            listed = {link.url for link in handler.index(url).chapters}
+    except Exception as e:
+        logger.info("Couldn't go through all of %s from the cache: %s", url, e)
+    finally:
+        session.cache.get_response = get_response
+        session.settings.only_if_cached = False
+        session.settings.stale_if_error = False
+    if chapters:
+        return used
+    if listed is None:
+        return {
+            key: response for key, response in used.items()
+            if get_url_expiration(response.request.url, session.settings.urls_expire_after) == sites.CACHE_INDEX
+        }
+    return {
+        key: response for key, response in used.items()
+        if response.request.url not in listed and response.url not in listed
+    }
+
+
 @cli.command()
+@click.argument('urls', nargs=-1)
+@click.option('--chapters/--no-chapters', default=False, help="Flush the stories' chapters too, rather than just their indexes")
 @click.option('--verbose', '-v', is_flag=True, help="verbose output")
-def flush(verbose):
-    """Flushes the contents of the cache."""
+def flush(urls, chapters, verbose):
+    """Flushes the cache, or just the pages for the stories at URLS.
+
+    Without --chapters, only the pages listing a story's chapters are
+    flushed, so the next download finds new chapters but reuses the old ones.
+    """
     configure_logging(verbose)
     session = create_session(True)
-    session.cache.clear()
+    if not urls:
+        session.cache.clear()
+        logger.info("Flushed cache")
+        return
+
+    for url in urls:
+        site, url = sites.get(url)
+        options, login = create_options(site, '{}', {})
+        keys = list(cached_story_responses(session, site, url, options, chapters=chapters))
+        session.cache.delete(*keys)
+        logger.info("Flushed %d cached pages for %s", len(keys), url)
+    session.close()
+
+
+@cli.group()
+def cache():
+    """Inspect or tidy up the HTTP cache."""
+    pass
+
+
+@cache.command()
+@click.option('--verbose', '-v', is_flag=True, help="verbose output")
+def stats(verbose):
+    """Shows how much is in the cache."""
+    configure_logging(verbose)
+    info = create_cache().stats()
+    click.echo(f"Location:  {info['path']}")
+    click.echo(f"Responses: {info['entries']} ({info['expired']} expired)")
+    click.echo(f"Size:      {ebook.image.get_size_format(info['size'])} of {ebook.image.get_size_format(info['max_size'])} allowed ({ebook.image.get_size_format(info['file_size'])} on disk)")
+    if info['oldest_use']:
+        click.echo(f"Used:      {datetime.datetime.fromtimestamp(info['oldest_use']):%Y-%m-%d %H:%M} to {datetime.datetime.fromtimestamp(info['newest_use']):%Y-%m-%d %H:%M}")
+
+
+@cache.command()
+@click.option('--max-size', type=click.IntRange(0), default=None, help="Size to prune down to, in megabytes (defaults to cache_max_size)")
+@click.option('--verbose', '-v', is_flag=True, help="verbose output")
+def prune(max_size, verbose):
+    """Evicts the least recently used responses until the cache fits its size limit."""
+    configure_logging(verbose)
+    evicted, freed = create_cache().prune(None if max_size is None else max_size * 1_000_000)
+    logger.info("Evicted %d responses, freeing %s", evicted, ebook.image.get_size_format(freed))
+
+
+def read_url_list(url_file):
+    """URLs from a file with one per line, skipping blank lines and # comments"""
+    for line in url_file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def host_shares(urls, jobs):
+    """How many of `jobs` worker processes might be fetching from each host
+    at once while building `urls`, for sites.share_limits. Stories defined
+    in local files could be on any host, so they count against all of them.
+    """
+    counts = collections.Counter(urllib.parse.urlparse(url).netloc for url in urls)
+    anywhere = counts.pop('', 0)
+    return {host: min(jobs, count + anywhere) for host, count in counts.items()}, min(jobs, anywhere) or 1
+
+
+def interleave_hosts(urls):
+    """Orders URLs round-robin by host, so a batch works through every site
+    at once rather than queueing everything else behind the biggest one"""
+    by_host = {}
+    for url in urls:
+        by_host.setdefault(urllib.parse.urlparse(url).netloc, []).append(url)
+    hosts = list(by_host.values())
+    while hosts:
+        for host in hosts:
+            yield host.pop(0)
+        hosts = [host for host in hosts if host]
+
 
-    logger.info("Flushed cache")
+def library_url(url):
+    """The URL to catalog a story under; stories defined in local files (as
+    with Arbitrary) go by their absolute path, so they're found from anywhere"""
+    return os.path.abspath(url) if os.path.isfile(url) else url
+
+
+def build_story(session, manifests, url, site_options, normalize, output_dir, user_agent, other_flags, checkpoints=None, resume=False, since=None, last=None, library=None):
+    """Downloads one story and writes its ebook, returning the filename.
+
+    With `checkpoints`, each chapter is saved as it's extracted, and with
+    `resume` the ones saved by an earlier run are picked up again. `since`
+    and `last` make a short ebook of just the recent chapters. With
+    `library`, the ebook is catalogued, so `library refresh` can rebuild it.
+    """
+    site, url = sites.get(url)
+    options, login = create_options(site, site_options, other_flags)
+    if UA := user_agent or options.get('user_agent'):
+        logger.debug('USER_AGENT overridden to "%s"', UA)
+        session.headers.update({'USER_AGENT': UA})
+    site_output_dir = Path(output_dir or options.get('output_dir', os.getcwd())).expanduser().resolve()
+    if not os.path.exists(site_output_dir):
+        raise click.ClickException(f"output directory doesn't exist: {site_output_dir}")
+    checkpoint = checkpoints.open(url, resume=resume) if checkpoints else None
+    recent = RecentChapters(since, last) if since or last else None
+    story = open_story(site, url, session, login, options, chapter_filters=[recent] if recent else (), manifests=manifests, checkpoint=checkpoint)
+    if story is None:
+        raise click.ClickException("No ebook created")
+    if recent:
+        recent.trim(story)
+        if not list(story.everychapter()):
+            raise click.ClickException(f"No chapters {recent.describe()}")
+    filename = ebook.generate_epub(
+        story, options,
+        image_options=image_options(options),
+        normalize=normalize,
+        # Not to be confused with (or overwrite) the whole story's ebook
+        output_filename=recent and f'{story.title} ({recent.describe()}).epub',
+        output_dir=site_output_dir,
+        allow_spaces=options.get('allow_spaces', False),
+        session=session,
+        parser=options.get('parser', 'lxml'),
+        manifests=manifests
+    )
+    logger.info("File created: " + filename)
+    if library is not None and not recent:
+        dates = [chapter.date for chapter in story.everychapter() if chapter.date]
+        library.record(storage.LibraryEntry(
+            url=library_url(url),
+            site=site.__name__,
+            title=story.title,
+            filename=filename,
+            chapters=[chapter.title for chapter in story.everychapter()],
+            latest=dates and max(dates, key=lambda date: date.timestamp()).isoformat() or None,
+            options={
+                'site_options': site_options,
+                'normalize': normalize,
+                'user_agent': user_agent,
+                'other_flags': {flag: value for flag, value in other_flags.items() if value is not None},
+            },
+        ))
+    if checkpoint and checkpoint.failed:
+        logger.warning("%d chapters couldn't be downloaded; run again with --resume to fill them in", len(checkpoint.failed))
+    elif checkpoint:
+        checkpoint.clear()
+    return filename
+
+
+@define
+class BatchResult:
+    url: str
+    filename: str | None = None
+    error: str | None = None
+    duration: float = 0.0
+
+
+def timed_build(session, manifests, url, *args, **kwargs):
+    """build_story, but catching failures, so one story can't sink a batch"""
+    started = time.monotonic()
+    try:
+        return BatchResult(url, filename=build_story(session, manifests, url, *args, **kwargs), duration=time.monotonic() - started)
+    except Exception as e:
+        if isinstance(e, click.ClickException):
+            logger.error("%s: %s", url, e.format_message())
+        else:
+            logger.exception("Couldn't download %s", url)
+        return BatchResult(url, error=str(e) or e.__class__.__name__, duration=time.monotonic() - started)
+
+
+# Each --jobs worker process keeps one session (and so one connection pool)
+# for every story it's given. The HTTP cache itself is shared between them,
+# through the cache database or directory.
+_worker = {}
+
+
+def _init_worker(cache, verbose, offline, shares=({}, 1)):
+    configure_logging(verbose)
+    sites.share_limits(*shares)
+    _worker['session'] = create_session(cache, offline)
+    _worker['manifests'] = create_manifests(cache)
+    _worker['checkpoints'] = create_checkpoints(cache)
+    _worker['library'] = create_library()
+    # Pool workers don't run atexit handlers, but they do run these; calling
+    # it closes the session early, for when this isn't a pool worker at all
+    _worker['close'] = multiprocessing.util.Finalize(None, close_session, args=(_worker['session'],), exitpriority=10)
+
+
+def _worker_build(url, *args, **kwargs):
+    return timed_build(
+        _worker['session'], _worker['manifests'], url, *args,
+        checkpoints=_worker['checkpoints'], library=_worker['library'], **kwargs
+    )
+
+
+def print_batch_summary(results):
+    width = max(len(result.url) for result in results)
+    click.echo(f"{'Story':<{width}}  {'Status':<6}  {'Time':>7}  Result")
+    for result in results:
+        status = 'ok' if result.filename else 'failed'
+        click.echo(f"{result.url:<{width}}  {status:<6}  {result.duration:>6.1f}s  {result.filename or result.error}")
+    failed = sum(1 for result in results if not result.filename)
+    click.echo(f"{len(results) - failed} succeeded, {failed} failed, {sum(result.duration for result in results):.1f}s in total")
 
 
 @cli.command()
-@click.argument('urls', nargs=-1, required=True)
+@click.argument('urls', nargs=-1)
+@click.option(
+    '--from-file',
+    type=click.File('r'),
+    default=None,
+    help='Read story URLs from this file, one per line ("-" for stdin)'
+)
+@click.option(
+    '--jobs', '-j',
+    type=click.IntRange(min=1),
+    default=1,
+    help='How many stories to build at once, each in its own process'
+)
 @click.option(
     '--site-options',
     default='{}',
@@ -187,44 +709,626 @@ def flush(verbose):
     help='Custom user-agent header'
 )
 @click.option('--cache/--no-cache', default=True)
+@click.option(
+    '--resume/--no-resume',
+    default=False,
+    help="Carry on from the chapters saved by an earlier download which didn't finish"
+)
+@click.option(
+    '--offline',
+    is_flag=True,
+    help="Build from the cache alone, never touching the network; whatever isn't cached fails"
+)
+@click.option(
+    '--since',
+    type=click.DateTime(formats=['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S']),
+    default=None,
+    help="Only the chapters posted since this date, in an ebook of their own"
+)
+@click.option(
+    '--last',
+    type=click.IntRange(min=1),
+    default=None,
+    help="Only the last so many chapters, in an ebook of their own"
+)
+@click.option('--normalize/--no-normalize', default=True, help="Whether to normalize strange unicode text")
+@click.option('--verbose', '-v', is_flag=True, help="Verbose debugging output")
+@site_specific_options  # Includes other click.options specific to sites
+@click.pass_context
+def download(ctx, urls, from_file, jobs, site_options, cache, resume, offline, since, last, verbose, normalize, output_dir, user_agent, **other_flags):
+    """Downloads a story and saves it on disk as an epub ebook.
+
+    Any number of stories can be given, on the command line or with
+    --from-file; with --jobs they're spread across worker processes, taking
+    turns between sites, which split each site's rate limits between them;
+    a summary is printed at the end.
+    """
+    configure_logging(verbose)
+    urls = list(urls) + (list(read_url_list(from_file)) if from_file else [])
+    if not urls:
+        raise click.UsageError("No stories to download: give some URLs, or --from-file")
+    if offline and not cache:
+        raise click.UsageError("Working --offline needs the cache")
+    args = (site_options, normalize, output_dir, user_agent, other_flags)
+
+    if jobs == 1:
+        session = create_session(cache, offline)
+        manifests = create_manifests(cache)
+        checkpoints = create_checkpoints(cache)
+        library = create_library()
+        results = [
+            timed_build(session, manifests, url, *args, checkpoints=checkpoints, resume=resume, since=since, last=last, library=library)
+            for url in urls
+        ]
+        close_session(session)
+    else:
+        initargs = (cache, verbose, offline, host_shares(urls, jobs))
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=initargs) as pool:
+            futures = [pool.submit(_worker_build, url, *args, resume=resume, since=since, last=last) for url in interleave_hosts(urls)]
+            results = [future.result() for future in futures]
+
+    if len(results) > 1:
+        print_batch_summary(results)
+    if any(not result.filename for result in results):
+        ctx.exit(1)
+
+
+@cli.command()
+@click.argument('epubs', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '--site-options',
+    default='{}',
+    help='JSON object encoding any site specific option.'
+)
+@click.option('--cache/--no-cache', default=True)
 @click.option('--normalize/--no-normalize', default=True, help="Whether to normalize strange unicode text")
 @click.option('--verbose', '-v', is_flag=True, help="Verbose debugging output")
 @site_specific_options  # Includes other click.options specific to sites
-def download(urls, site_options, cache, verbose, normalize, output_dir, user_agent, **other_flags):
-    """Downloads a story and saves it on disk as an epub ebook."""
+def update(epubs, site_options, cache, verbose, normalize, **other_flags):
+    """Adds new chapters to epub ebooks made by leech, fetching only those."""
     configure_logging(verbose)
     session = create_session(cache)
+    manifests = create_manifests(cache)
 
-    for url in urls:
-        site, url = sites.get(url)
+    for filename in epubs:
+        book = ebook.read_epub(filename)
+        try:
+            site, url = sites.get(book.meta['unique_id'])
+        except NotImplementedError:
+            logger.error("Can't tell where %s came from (%s)", filename, book.meta['unique_id'])
+            continue
         options, login = create_options(site, site_options, other_flags)
-        if UA := user_agent or options.get('user_agent'):
-            logger.debug('USER_AGENT overridden to "%s"', UA)
-            session.headers.update({'USER_AGENT': UA})
-        site_output_dir = Path(output_dir or options.get('output_dir', os.getcwd())).expanduser().resolve()
-        if not os.path.exists(site_output_dir):
-            logger.warning("output directory doesn't exist: %s", site_output_dir)
-            return
-        story = open_story(site, url, session, login, options)
-        if story:
+
+        held = ebook.held_chapters(book)
+        footnotes = next((file for file in book.files if file.path.endswith('/footnotes.html')), None)
+        skip = SkipHeldChapters(
+            [chapter.title for chapter in held],
+            footnotes and len(re.findall(rb'id="footnote\d+"', footnotes.contents)) or 0
+        )
+        story = open_story(site, url, session, login, options, chapter_filters=[skip], manifests=manifests)
+        if story is None:
+            logger.warning("Couldn't update %s", filename)
+            continue
+
+        if skip.skipped is None:
+            # The site can't skip chapters, so it fetched them all. Keep just
+            # the new ones, as long as the old ones line up with the ebook.
+            chapters = list(story.everychapter())
+            titles = comparable_titles(chapter.title for chapter in chapters[:len(held)])
+            if not story.footnotes and titles == comparable_titles(chapter.title for chapter in held):
+                skip.skipped = len(held)
+                story.contents = chapters[len(held):]
+
+        if not skip.skipped:
             filename = ebook.generate_epub(
                 story, options,
-                image_options={
-                    'image_fetch': options.get('image_fetch', True),
-                    'image_format': options.get('image_format', 'jpeg'),
-                    'compress_images': options.get('compress_images', False),
-                    'max_image_size': options.get('max_image_size', 1_000_000),
-                    'always_convert_images': options.get('always_convert_images', False)
-                },
+                image_options=image_options(options),
                 normalize=normalize,
-                output_dir=site_output_dir,
+                output_filename=os.path.basename(filename),
+                output_dir=os.path.dirname(filename),
                 allow_spaces=options.get('allow_spaces', False),
                 session=session,
-                parser=options.get('parser', 'lxml')
+                parser=options.get('parser', 'lxml'),
+                manifests=manifests
             )
-            logger.info("File created: " + filename)
+            logger.info("File rebuilt: %s", filename)
+        elif not story.contents:
+            logger.info("No new chapters for %s", filename)
+        else:
+            ebook.update_epub(
+                book, story,
+                image_options=image_options(options),
+                normalize=normalize,
+                session=session,
+                manifests=manifests
+            )
+            logger.info("Added %d chapters to %s", len(list(story.everychapter())), filename)
+
+    close_session(session)
+
+
+@cli.command()
+@click.argument('urls', nargs=-1, required=True)
+@click.option('--all', 'show_all', is_flag=True, help="List every story, not just those with new chapters")
+@click.option(
+    '--site-options',
+    default='{}',
+    help='JSON object encoding any site specific option.'
+)
+@click.option('--cache/--no-cache', default=True)
+@click.option('--verbose', '-v', is_flag=True, help="Verbose debugging output")
+@site_specific_options  # Includes other click.options specific to sites
+@click.pass_context
+def check(ctx, urls, show_all, site_options, cache, verbose, **other_flags):
+    """Reports, as JSON, which stories have new chapters since their last build.
+
+    Only each story's index is fetched. Chapters count as new if they weren't
+    in the last ebook leech built for the story, going by its manifest.
+    """
+    configure_logging(verbose)
+    session = create_session(cache)
+    # Only read, so --no-cache still gets compared against the last build
+    manifests = create_manifests(True)
+    report = []
+    for url in urls:
+        try:
+            site, url = sites.get(url)
+            options, login = create_options(site, site_options, other_flags)
+            index = index_story(site, url, session, login, options)
+        except Exception as e:
+            logger.exception("Couldn't check %s", url)
+            report.append({'url': url, 'error': str(e) or e.__class__.__name__})
+            continue
+        manifest = manifests.open(index)
+        known = set(comparable_titles(chapter.title for chapter in manifest.chapters.values()))
+        new = [chapter for chapter in index.chapters if comparable_titles([chapter.title])[0] not in known]
+        if new or show_all:
+            latest = index.latest()
+            report.append({
+                'url': index.url,
+                'title': index.title,
+                'chapters': len(index.chapters) if index.complete else None,
+                'latest': latest and latest.isoformat(),
+                'built': bool(manifest.chapters),
+                'new': [{'title': chapter.title, 'url': chapter.url} for chapter in new],
+            })
+    click.echo(json.dumps(report, indent=2))
+    close_session(session)
+    if any('error' in story for story in report):
+        ctx.exit(1)
+
+
+def watch_list():
+    return storage.WatchList(dirs.user_data_path / 'watch.json')
+
+
+@cli.group(cls=DefaultGroup, default='run', default_if_no_args=True)
+def watch():
+    """Follow stories, rebuilding their ebooks when new chapters turn up."""
+    pass
+
+
+@watch.command('add')
+@click.argument('urls', nargs=-1, required=True)
+@click.option('--output-dir', default=None, help='Directory to save their ebooks')
+def watch_add(urls, output_dir):
+    """Starts following the stories at URLS."""
+    watched = watch_list()
+    for url in urls:
+        sites.get(url)  # so an unsupported URL fails now, rather than at every check
+        watched.add(url, output_dir and str(Path(output_dir).expanduser().resolve()))
+    watched.save()
+
+
+@watch.command('remove')
+@click.argument('urls', nargs=-1, required=True)
+def watch_remove(urls):
+    """Stops following the stories at URLS."""
+    watched = watch_list()
+    for url in urls:
+        if not watched.remove(url):
+            logger.warning("Wasn't following %s", url)
+    watched.save()
+
+
+@watch.command('list')
+def watch_list_command():
+    """Shows the followed stories, and when each is next due a check."""
+    for story in watch_list():
+        next_check = datetime.datetime.fromtimestamp(story.next_check).strftime('%Y-%m-%d %H:%M') if story.next_check else 'now'
+        click.echo(f"{story.url}  {len(story.chapters)} chapters, every {datetime.timedelta(seconds=story.interval)}, next {next_check}")
+
+
+def check_watched(story, session, manifests, checkpoints, library, site_options, normalize, other_flags):
+    """Polls one followed story's index, and rebuilds its ebook if the
+    chapters have changed (or it hasn't got one yet)"""
+    try:
+        site, url = sites.get(story.url)
+        options, login = create_options(site, site_options, other_flags)
+        titles = comparable_titles(link.title for link in index_story(site, url, session, login, options).chapters)
+        changed = titles != story.chapters
+        if changed or not (story.filename and os.path.exists(story.filename)):
+            if story.chapters:
+                logger.info("The chapters of %s have changed: %d, from %d", story.url, len(titles), len(story.chapters))
+            # Resuming, so chapters a failed check left out get filled in
+            story.filename = build_story(
+                session, manifests, story.url, site_options, normalize, story.output_dir, None, other_flags,
+                checkpoints=checkpoints, resume=True, library=library
+            )
+        story.chapters = titles
+    except Exception:
+        logger.exception("Couldn't check %s", story.url)
+        changed = False
+    story.checked(changed)
+    logger.info("Next checking %s in %s", story.url, datetime.timedelta(seconds=story.interval))
+
+
+@watch.command('run')
+@click.option('--once', is_flag=True, help="Check whatever's due and exit, rather than keep running")
+@click.option(
+    '--site-options',
+    default='{}',
+    help='JSON object encoding any site specific option.'
+)
+@click.option('--cache/--no-cache', default=True)
+@click.option('--normalize/--no-normalize', default=True, help="Whether to normalize strange unicode text")
+@click.option('--verbose', '-v', is_flag=True, help="Verbose debugging output")
+@site_specific_options  # Includes other click.options specific to sites
+def watch_run(once, site_options, cache, verbose, normalize, **other_flags):
+    """Checks the followed stories as they come due, rebuilding any with new chapters.
+
+    Only each story's index is fetched for a check, revalidating what's
+    cached, so an unchanged index costs a conditional request on sites which
+    support them. Stories that don't change get checked less and less often.
+    """
+    configure_logging(verbose)
+    session = create_session(cache)
+    manifests = create_manifests(cache)
+    checkpoints = create_checkpoints(cache)
+    library = create_library()
+    try:
+        while True:
+            # Read afresh every time round, to pick up `watch add` / `watch remove`
+            due = {story.url: story for story in watch_list().due()}
+            for story in (due[url] for url in interleave_hosts(due)):
+                check_watched(story, session, manifests, checkpoints, library, site_options, normalize, other_flags)
+                watched = watch_list()
+                if story.url in watched.stories:
+                    watched.stories[story.url] = story
+                    watched.save()
+            if once:
+                break
+            next_check = watch_list().next_check()
+            # Not too long, so newly added stories get their first look promptly
+            time.sleep(min(max((next_check or 0) - time.time(), 1), WATCH_IDLE))
+    finally:
+        close_session(session)
+
+
+@cli.group()
+def library():
+    """The catalog of every ebook leech has built."""
+    pass
+
+
+@library.command('list')
+@click.option('--json', 'as_json', is_flag=True, help="Print the catalog as JSON")
+def library_list(as_json):
+    """Shows every catalogued story, and what went into its ebook."""
+    entries = list(create_library())
+    if as_json:
+        click.echo(json.dumps([{
+            'url': entry.url,
+            'site': entry.site,
+            'title': entry.title,
+            'filename': entry.filename,
+            'chapters': len(entry.chapters),
+            'latest': entry.latest,
+            'built': datetime.datetime.fromtimestamp(entry.built).isoformat(),
+            'options': entry.options,
+        } for entry in entries], indent=2))
+        return
+    for entry in entries:
+        built = datetime.datetime.fromtimestamp(entry.built).strftime('%Y-%m-%d %H:%M')
+        latest = entry.latest[:10] if entry.latest else 'unknown'
+        click.echo(f"{entry.title} ({entry.site}): {len(entry.chapters)} chapters, latest {latest}, built {built}")
+        click.echo(f"    {entry.url}")
+        click.echo(f"    {entry.filename}")
+
+
+@library.command('remove')
+@click.argument('urls', nargs=-1, required=True)
+def library_remove(urls):
+    """Drops the stories at URLS from the catalog; their ebooks are left alone."""
+    catalog = create_library()
+    for url in urls:
+        if not catalog.remove(library_url(sites.get(url)[1])):
+            logger.warning("%s isn't in the library", url)
+
+
+def stale_reason(session, entry):
+    """Why a catalogued story's ebook needs rebuilding, going by its index
+    alone; None if it's up to date"""
+    if not os.path.exists(entry.filename):
+        return "the ebook is missing"
+    site, url = sites.get(entry.url)
+    options, login = create_options(site, entry.options['site_options'], entry.options['other_flags'])
+    index = index_story(site, url, session, login, options)
+    known = set(comparable_titles(entry.chapters))
+    new = [title for title in comparable_titles(chapter.title for chapter in index.chapters) if title not in known]
+    if new:
+        return f"{len(new)} new chapters"
+    if index.complete and len(index.chapters) != len(entry.chapters):
+        return f"{len(index.chapters)} chapters, from {len(entry.chapters)}"
+
+
+def _worker_stale(entry):
+    try:
+        return stale_reason(_worker['session'], entry), None
+    except Exception as e:
+        logger.exception("Couldn't check %s", entry.url)
+        return None, str(e) or e.__class__.__name__
+
+
+def _worker_rebuild(entry):
+    return _worker_build(
+        entry.url, entry.options['site_options'], entry.options['normalize'], os.path.dirname(entry.filename),
+        entry.options['user_agent'], entry.options['other_flags'], resume=True
+    )
+
+
+@library.command('refresh')
+@click.argument('urls', nargs=-1)
+@click.option(
+    '--jobs', '-j',
+    type=click.IntRange(min=1),
+    default=1,
+    help='How many stories to check and build at once, each in its own process'
+)
+@click.option('--dry-run', is_flag=True, help="Just report which stories are stale, without rebuilding them")
+@click.option('--cache/--no-cache', default=True)
+@click.option('--verbose', '-v', is_flag=True, help="Verbose debugging output")
+@click.pass_context
+def library_refresh(ctx, urls, jobs, dry_run, cache, verbose):
+    """Rebuilds the catalogued stories which have new chapters.
+
+    Every story's index is checked (or just those at URLS), with --jobs of
+    them at once, and only the stale ones are rebuilt, with the options they
+    were built with last time.
+    """
+    configure_logging(verbose)
+    urls = {library_url(sites.get(url)[1]) for url in urls}
+    catalog = {entry.url: entry for entry in create_library() if not urls or entry.url in urls}
+    entries = [catalog[url] for url in interleave_hosts(catalog)]
+    if not entries:
+        logger.info("Nothing in the library to refresh")
+        return
+
+    # The same worker processes (and their sessions) do the checking and
+    # then the rebuilding; with just the one job, it's all done here
+    if jobs > 1:
+        initargs = (cache, verbose, False, host_shares([entry.url for entry in entries], jobs))
+        pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=initargs)
+    else:
+        pool = None
+        _init_worker(cache, verbose, False)
+    run = pool.map if pool else map
+    try:
+        stale, failed = [], []
+        for entry, (reason, error) in zip(entries, run(_worker_stale, entries)):
+            if error:
+                failed.append(BatchResult(entry.url, error=error))
+            elif reason:
+                logger.info("%s is stale: %s", entry.title, reason)
+                stale.append(entry)
+        logger.info("%d of %d stories are up to date", len(entries) - len(stale) - len(failed), len(entries))
+        results = failed + (list(run(_worker_rebuild, stale)) if stale and not dry_run else [])
+    finally:
+        if pool:
+            pool.shutdown()
         else:
-            logger.warning("No ebook created")
+            _worker['close']()
+
+    if results:
+        print_batch_summary(results)
+    if any(not result.filename for result in results):
+        ctx.exit(1)
+
+
+@define
+class Job:
+    """A story queued up by `leech serve`"""
+    id: str
+    url: str
+    site_options: str = '{}'
+    normalize: bool = True
+    # queued, running, done or failed
+    status: str = 'queued'
+    filename: str | None = None
+    error: str | None = None
+    submitted: float = Factory(time.time)
+    duration: float | None = None
+
+    def describe(self):
+        description = {
+            'id': self.id,
+            'url': self.url,
+            'status': self.status,
+            'submitted': datetime.datetime.fromtimestamp(self.submitted).isoformat(),
+            'duration': self.duration,
+            'links': {'self': f'/jobs/{self.id}'},
+        }
+        if self.status == 'done':
+            description['links']['epub'] = f'/jobs/{self.id}/epub'
+        if self.error:
+            description['error'] = self.error
+        return description
+
+
+class JobQueue:
+    """Builds the stories submitted to `leech serve`, on a few worker
+    threads which each keep a session open for as long as the server runs.
+
+    Only the last `keep` finished jobs are remembered; older ones are
+    forgotten, and their ebooks deleted.
+    """
+
+    def __init__(self, workers, cache, output_dir, keep=100):
+        self.output_dir = Path(output_dir)
+        self.keep = keep
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        # Nothing knows about the jobs from an earlier run any more
+        if self.output_dir.is_dir():
+            for path in self.output_dir.iterdir():
+                if path.is_dir() and re.fullmatch(r'[0-9a-f]{32}', path.name):
+                    shutil.rmtree(path, ignore_errors=True)
+        manifests = create_manifests(cache)
+        for i in range(workers):
+            threading.Thread(
+                target=self._work, args=(create_session(cache), manifests), name=f'leech-job-{i}', daemon=True
+            ).start()
+
+    def submit(self, url, site_options='{}', normalize=True):
+        job = Job(uuid.uuid4().hex, url, site_options=site_options, normalize=normalize)
+        with self.lock:
+            self.jobs[job.id] = job
+        self.queue.put(job)
+        return job
+
+    def _expire(self):
+        with self.lock:
+            finished = [job for job in self.jobs.values() if job.status in ('done', 'failed')]
+            expired = finished[:max(len(finished) - self.keep, 0)]
+            for job in expired:
+                del self.jobs[job.id]
+        for job in expired:
+            shutil.rmtree(self.output_dir / job.id, ignore_errors=True)
+
+    def _work(self, session, manifests):
+        # Building a story leaves its User-Agent and Referer on the session
+        headers = dict(session.headers)
+        while True:
+            job = self.queue.get()
+            job.status = 'running'
+            session.headers.clear()
+            session.headers.update(headers)
+            output_dir = self.output_dir / job.id
+            output_dir.mkdir(parents=True, exist_ok=True)
+            result = timed_build(session, manifests, job.url, job.site_options, job.normalize, output_dir, None, {})
+            job.filename, job.error, job.duration = result.filename, result.error, result.duration
+            job.status = 'done' if result.filename else 'failed'
+            self._expire()
+            self.queue.task_done()
+
+
+class JobRequestHandler(http.server.BaseHTTPRequestHandler):
+    """The JSON API for `leech serve`:
+
+    POST /jobs           {"url": ..., "site_options": {...}, "normalize": true}; 202 with the job
+    GET  /jobs           every job
+    GET  /jobs/ID        one job, with its status
+    GET  /jobs/ID/epub   the ebook, once the job is done
+    """
+    server_version = f'Leech/{__version__}'
+
+    def send_json(self, status, data, headers=()):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {'error': message})
+
+    def find_job(self, parts):
+        job = self.server.jobs.jobs.get(parts[1])
+        if not job:
+            self.send_error_json(404, "No such job")
+        return job
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts == ['jobs']:
+            return self.send_json(200, [job.describe() for job in list(self.server.jobs.jobs.values())])
+        if len(parts) == 2 and parts[0] == 'jobs':
+            if job := self.find_job(parts):
+                self.send_json(200, job.describe())
+            return
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'epub':
+            if not (job := self.find_job(parts)):
+                return
+            if job.status != 'done':
+                return self.send_error_json(409, f"The job is {job.status}")
+            with open(job.filename, 'rb') as epub:
+                body = epub.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/epub+zip')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Content-Disposition', f'attachment; filename="{urllib.parse.quote(os.path.basename(job.filename))}"')
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_error_json(404, "Not found")
+
+    def do_POST(self):
+        if self.path.strip('/') != 'jobs':
+            return self.send_error_json(404, "Not found")
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or '{}')
+            url = request['url']
+            sites.get(url)
+        except (ValueError, KeyError, TypeError):
+            return self.send_error_json(400, 'Expected a JSON object with a "url"')
+        except NotImplementedError as e:
+            return self.send_error_json(400, str(e))
+        job = self.server.jobs.submit(
+            url,
+            site_options=json.dumps(request.get('site_options') or {}),
+            normalize=request.get('normalize', True)
+        )
+        self.send_json(202, job.describe(), headers=[('Location', f'/jobs/{job.id}')])
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', help='Address to listen on')
+@click.option('--port', default=8000, type=int, help='Port to listen on')
+@click.option('--workers', default=2, type=click.IntRange(min=1), help='How many stories to build at once')
+@click.option('--keep-jobs', default=100, type=click.IntRange(min=1), help='How many finished jobs (and their ebooks) to keep around')
+@click.option(
+    '--output-dir',
+    default=None,
+    type=click.Path(file_okay=False),
+    help='Directory to keep the built ebooks in (by default, in the user cache directory)'
+)
+@click.option('--cache/--no-cache', default=True)
+@click.option('--verbose', '-v', is_flag=True, help="Verbose debugging output")
+def serve(host, port, workers, keep_jobs, output_dir, cache, verbose):
+    """Runs a JSON API for building ebooks, in one long-lived process.
+
+    Stories are submitted with POST /jobs, which returns straight away (202)
+    with the job; poll GET /jobs/ID until it's done, then fetch
+    GET /jobs/ID/epub. The sessions, caches and sites stay loaded in between,
+    and only the last --keep-jobs finished jobs are kept.
+    """
+    configure_logging(verbose)
+    server = http.server.ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.jobs = JobQueue(workers, cache, output_dir or dirs.user_cache_path / 'serve', keep=keep_jobs)
+    logger.info("Listening on http://%s:%d/", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
 
 
 if __name__ == '__main__':
@@ -1,23 +1,306 @@
 
+import asyncio
 import click
+import codecs
+import copy
+import functools
 import glob
+import html
 import os
 import random
 import uuid
 import datetime
+import email.utils
 import time
 import logging
+import multiprocessing
 import re
 import hashlib
+import threading
 import requests
+import urllib3
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from urllib import parse as urlparse
 from attrs import define, field, Factory
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.dammit import EncodingDetector
+from lxml import etree
+import lxml.html
+from requests_cache.policy import CacheActions
+from requests_cache.session import get_504_response
+from storage.manifest import content_hash
+
+try:
+    # Optional: only needed by the async engine, which falls back to running
+    # the regular session in threads without it. `pip install leech[async]`
+    import httpx
+except ImportError:
+    httpx = None
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 _sites = []
 
+# Exceptions from a request which are worth another try
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout)
+if httpx is not None:
+    RETRYABLE_ERRORS += (httpx.TransportError,)
+
+# Upper bound on the --concurrency option; also used to size the connection
+# pools in leech.create_session, so every worker can keep a connection alive.
+MAX_CONCURRENCY = 16
+
+# Cache lifetimes for Site.cache_policies: pages which list a story's chapters
+# change whenever the author posts, while the chapters themselves rarely do.
+CACHE_INDEX = datetime.timedelta(minutes=30)
+CACHE_CHAPTER = datetime.timedelta(days=90)
+
+# Images are cached as long as chapters, whichever site they're hosted on
+IMAGE_URL = re.compile(r'\.(?:jpe?g|png|gif|webp)(?:\?|$)', re.IGNORECASE)
+
+# The --parser which cleans chapters with lxml itself, on sites which support
+# it (those with `native = True`); everywhere else it's the same as lxml.
+NATIVE_PARSER = 'lxml-native'
+
+# So lxml writes epub:type attributes the way the ebook's templates expect
+EPUB_NAMESPACE = 'http://www.idpf.org/2007/ops'
+etree.register_namespace('epub', EPUB_NAMESPACE)
+
+
+def has_class(name):
+    """An XPath condition matching elements with the HTML class `name`"""
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+def is_tree(node):
+    """Whether `node` is from an lxml tree (see Site._tree), not a soup"""
+    return isinstance(node, etree.ElementBase)
+
+
+def wrap_tree(element, name):
+    """Wraps an lxml element in a new one, as bs4's Tag.wrap does"""
+    wrapper = lxml.html.Element(name)
+    element.addprevious(wrapper)
+    wrapper.tail, element.tail = element.tail, None
+    wrapper.append(element)
+    return wrapper
+
+
+def replace_tree(element, new):
+    """Puts a new lxml element where an old one was, as bs4's Tag.replace_with does"""
+    new.tail, element.tail = element.tail, None
+    element.getparent().replace(element, new)
+    return new
+
+
+def replace_tree_with_text(element, text):
+    """Replaces an lxml element with some text, as bs4's Tag.replace_with does"""
+    element.tail = text + (element.tail or '')
+    element.drop_tree()
+
+
+_CF_EMAILS = etree.XPath(f'.//*[{has_class("__cf_email__")}][@data-cfemail]')
+_STYLED = etree.XPath('.//*[@style]')
+_IMAGES = etree.XPath('.//img')
+_IMAGES_WITH_SRC = etree.XPath('.//img[@src]')
+_BASE = etree.XPath('/html/head/base/@href')
+
+
+# The start of a CSS selector which can be matched as a page is parsed: a tag
+# name, #id and .classes, then a descendant or child combinator (or nothing)
+_SIMPLE_SELECTOR = re.compile(r'([a-zA-Z][\w-]*)?((?:[#.][\w-]+)*)(?:\s*>\s*|\s+|$)')
+
+
+class RegionStrainer(SoupStrainer):
+    """A SoupStrainer keeping the elements which match any of several others,
+    where a single SoupStrainer needs all of its rules to match at once"""
+
+    def __init__(self, strainers):
+        super().__init__()
+        self.strainers = strainers
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return any(strainer.allow_tag_creation(nsprefix, name, attrs) for strainer in self.strainers)
+
+
+@functools.lru_cache
+def region_strainer(selectors):
+    """A SoupStrainer for parsing only the regions of a page which CSS
+    `selectors` (a comma-separated group, as for select()) can match,
+    along with any <base>. Returns None if they're not simple enough.
+
+    Only the first part of each selector needs to be simple: a tag name, an
+    #id, .classes. Elements matching that are kept whole, so the rest of the
+    selector can still be matched inside them afterwards.
+    """
+    strainers = [SoupStrainer('base')]
+    for selector in selectors.split(','):
+        selector = selector.strip()
+        match = _SIMPLE_SELECTOR.match(selector)
+        if not match or not any(match.groups()) or selector[match.end():].startswith(('+', '~')):
+            logger.debug("Can't parse just the regions matching %r; parsing pages whole", selectors)
+            return None
+        attrs = {}
+        classes = set()
+        for kind, value in re.findall(r'([#.])([\w-]+)', match.group(2)):
+            if kind == '#':
+                attrs['id'] = value
+            else:
+                classes.add(value)
+        if classes:
+            # The parser hands over class attributes unsplit
+            attrs['class'] = lambda value, classes=frozenset(classes): bool(value) and classes <= set(value.split())
+        strainers.append(SoupStrainer(match.group(1) and match.group(1).lower(), attrs))
+    return RegionStrainer(strainers)
+
+
+# A charset given in a Content-Type header
+_CHARSET = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+# Labels which browsers take to mean something broader, so should we
+_BROWSER_ENCODINGS = {'ascii': 'cp1252', 'iso8859-1': 'cp1252'}
+
+
+def _codec(name):
+    """Python's name for the encoding labelled `name`, or None if it's not one"""
+    try:
+        name = codecs.lookup(name).name
+    except (LookupError, TypeError):
+        return None
+    return _BROWSER_ENCODINGS.get(name, name)
+
+
+@functools.lru_cache(maxsize=None)
+def _unknown_encoding(name):
+    # Just the once for each name, rather than for every page
+    logger.warning("Ignoring the encoding %r, which isn't one Python knows; working it out from the pages instead", name)
+
+
+def page_encoding(page, hint=None):
+    """Works out how a fetched page's bytes are encoded, without the charset
+    detection requests' page.text runs over the whole of a page whose
+    headers don't say (which is slow on big ones, and often wrong).
+
+    In order: `hint`, a byte order mark, the Content-Type header, then a
+    <meta charset> near the top of the page. Failing all those, it's UTF-8
+    if the page decodes as that, or else windows-1252, as browsers assume.
+
+    Returns:
+        (encoding, which of those it came from)
+    """
+    content = page.content
+    if hint:
+        if encoding := _codec(hint):
+            return encoding, 'hint'
+        _unknown_encoding(hint)
+    if encoding := _codec(EncodingDetector.strip_byte_order_mark(content[:4])[1]):
+        return encoding, 'byte order mark'
+    if (charset := _CHARSET.search(page.headers.get('Content-Type', ''))) and (encoding := _codec(charset.group(1))):
+        return encoding, 'header'
+    if encoding := _codec(EncodingDetector.find_declared_encoding(content, is_html=True)):
+        # A page can't declare itself UTF-16 in markup it could be read from as ASCII
+        return 'utf-8' if encoding.startswith('utf-16') else encoding, 'meta'
+    if content.isascii():
+        return 'utf-8', 'default'
+    try:
+        content.decode('utf-8')
+    except UnicodeDecodeError:
+        return 'cp1252', 'default'
+    return 'utf-8', 'default'
+
+
+@functools.lru_cache
+def _tag_factory(parser):
+    """An empty soup to make new tags from, one per parser, rather than
+    building a fresh one for every tag"""
+    return BeautifulSoup('', parser)
+
+
+@define
+class ShippedPage:
+    """A fetched page, cut down to what parsing it needs, for shipping to a
+    pool worker (see Site._add_pooled_chapters)"""
+    url: str
+    content: bytes
+    headers: dict
+    status_code: int = 200
+
+    def __bool__(self):
+        return True
+
+
+class _ReplaySession:
+    """Stands in for a pool worker's session, answering with the pages
+    shipped to it rather than going out to the network"""
+
+    def __init__(self):
+        self.pages = {}
+
+    def get(self, url, **kw):
+        if url not in self.pages:
+            raise SiteException("Page wasn't shipped to the worker", url)
+        return self.pages[url]
+
+
+# A site to make chapters with, per class, in each pool worker
+_worker_sites = {}
+
+
+def _make_in_worker(site_class, options, placeholder, fetch, make, link, page):
+    """Makes the chapters for `link` in a pool worker, from its shipped
+    `page`, by calling the site's `fetch` and `make` methods as
+    _extract_chapters would. Images are processed here too, so finalizing
+    needn't parse them again.
+
+    Returns:
+        (chapters, footnotes, and for each chapter: its contents with
+        images processed and the image URLs, or None if it has no images,
+        or False if it wasn't serialized the usual way and needs parsing)
+    """
+    site = _worker_sites.get(site_class)
+    if site is None or site.options != options:
+        site = _worker_sites[site_class] = site_class(session=_ReplaySession(), options=options)
+    # The pool outlives the story, and each story has its own placeholder
+    site._placeholder = placeholder
+    site.footnotes = []
+    site._trees.clear()
+    site.session.pages = {page.url: page}
+    chapters = getattr(site, make)(link, getattr(site, fetch)(link.url), 1)
+    chapters = chapters if isinstance(chapters, list) else [chapters]
+    finalized = []
+    for chapter in chapters:
+        contents = chapter.contents
+        if contents not in site._trees:
+            finalized.append(False)
+        elif site._trees[contents] is None:
+            finalized.append(None)
+        else:
+            site._process_images(chapter)
+            finalized.append((chapter.contents, list(chapter.images)))
+            chapter.contents, chapter.images = contents, {}
+    return chapters, site.footnotes, finalized
+
+
+# The pools chapters are made in, by number of processes; shared by every
+# story this run, so workers are only started once
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _process_pool(processes):
+    """The pool of `processes` workers to make chapters in (see
+    Site._add_pooled_chapters), started the first time it's needed"""
+    with _pools_lock:
+        pool = _pools.get(processes)
+        # A worker dying takes the whole pool with it
+        if pool is None or pool._broken:
+            # Forking while the fetch threads (or serve's workers) hold locks
+            # can leave a worker stuck on one, so they start from a clean
+            # process; Windows has no forkserver
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            pool = _pools[processes] = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(method))
+        return pool
+
 
 def _default_uuid_string(self):
     rd = random.Random(x=self.url)
@@ -45,6 +328,32 @@ class Chapter:
     contents: str
     date: datetime.datetime | None = None
     images: dict = Factory(dict)
+    # Where the chapter came from, if it has a page of its own
+    url: str | None = None
+
+
+@define
+class ChapterLink:
+    """A chapter as listed in a story's index, before it's been fetched"""
+    title: str
+    url: str
+    date: datetime.datetime | None = None
+
+
+@define
+class StoryIndex:
+    """What a story's index says about it, without the chapters themselves"""
+    title: str
+    url: str
+    chapters: list = Factory(list)
+    # False if `chapters` is only the most recent ones
+    complete: bool = True
+    # Matches the Section's id, for the same URL
+    id: str = Factory(_default_uuid_string, takes_self=True)
+
+    def latest(self):
+        dates = [chapter.date for chapter in self.chapters if chapter.date]
+        return max(dates) if dates else None
 
 
 @define
@@ -94,12 +403,47 @@ class Site:
     """A Site handles checking whether a URL might represent a site, and then
     extracting the content of a story from said site.
     """
+    # Statuses worth retrying: either numbers, or classes like "5xx". Can be
+    # overridden per site with `retry_statuses` in leech.json.
+    retry_statuses = (408, 425, 429, '5xx')
+    # Whether the site can parse and clean its chapters with lxml itself,
+    # given --parser lxml-native; see _page and the other *_tree methods.
+    native = False
+    # The encoding of the site's pages, if its headers and markup get it wrong;
+    # `encoding` in the site's options overrides it. See page_encoding.
+    encoding = None
+    # CSS selectors (see region_strainer) for the only parts of its chapter
+    # pages the site needs, so _chapter_soup needn't build the rest of them
+    regions = None
+
     session: requests.Session = field()
     footnotes: list = field(factory=list, init=False)
     options: dict = Factory(
         lambda site: site.get_default_options(),
         takes_self=True
     )
+    # Callables which take this site and the ChapterLinks from a story's index
+    # and return the ones to fetch; see _filter_chapters.
+    chapter_filters: list = Factory(list)
+    # Where chapter and footnote numbering carries on from, when the chapters
+    # being extracted will follow on from ones in an existing ebook.
+    chapter_offset: int = 0
+    footnote_offset: int = 0
+    # A storage.ManifestStore, to reuse chapters which haven't changed since
+    # the last build rather than finalizing them again.
+    manifests: object = None
+    # A storage.Checkpoint, to save each chapter as it's extracted and pick
+    # up from the saved ones; see _extract_chapters.
+    checkpoint: object = None
+    # The contents _soup_contents has serialized, with their cleaned trees if
+    # they've images to rewrite, so _process_images needn't parse them again
+    _trees: dict = field(factory=dict, init=False, repr=False)
+    # In a pool worker, what footnote and chapter numbers are written as
+    # until they're known; see _make_in_worker and _adopt_chapters
+    _placeholder: str | None = field(default=None, init=False, repr=False)
+    # Each story gets its own, so those built at once (e.g. under serve)
+    # don't spend each other's
+    _retry_budget: 'RetryBudget' = field(factory=lambda: RetryBudget(), init=False, repr=False)
 
     @classmethod
     def site_key(cls):
@@ -138,10 +482,59 @@ class Site:
             SiteSpecificOption(
                 'parser',
                 '--parser',
-                help="Which HTML parser to use",
-                choices=('lxml', 'html5lib', 'html.parser', 'lxml-xml'),
+                help="Which HTML parser to use; lxml-native cleans chapters with lxml directly, on sites which support it",
+                choices=('lxml', 'html5lib', 'html.parser', 'lxml-xml', NATIVE_PARSER),
                 default='lxml',
             ),
+            SiteSpecificOption(
+                'concurrency',
+                '--concurrency',
+                type=click.IntRange(1, MAX_CONCURRENCY),
+                default=4,
+                help="Most chapters to fetch at once from any one host; fewer if the site pushes back"
+            ),
+            SiteSpecificOption(
+                'processes',
+                '--processes',
+                type=click.IntRange(1),
+                default=1,
+                help="How many processes to clean chapters in, on sites which support it; worth it when the pages are already cached"
+            ),
+            SiteSpecificOption(
+                'retries',
+                '--retries',
+                type=click.IntRange(0),
+                default=3,
+                help="How many times to retry a failed request"
+            ),
+            SiteSpecificOption(
+                'retry_backoff',
+                '--retry-backoff',
+                type=float,
+                default=2,
+                help="Seconds to wait before the first retry; doubles (with jitter) each time after"
+            ),
+            SiteSpecificOption(
+                'retry_budget',
+                '--retry-budget',
+                type=click.IntRange(0),
+                default=50,
+                help="Most retries to make for each story before giving up on failures immediately"
+            ),
+            SiteSpecificOption(
+                'rate_limit',
+                '--rate-limit',
+                type=float,
+                default=0,
+                help="Most requests per second to make to the site (0 for no limit)"
+            ),
+            SiteSpecificOption(
+                'rate_burst',
+                '--rate-burst',
+                type=click.IntRange(1),
+                default=1,
+                help="How many requests may go out back-to-back before --rate-limit applies"
+            ),
         ]
 
     @classmethod
@@ -166,6 +559,16 @@ class Site:
                 options[option.name] = option_value
         return options
 
+    @classmethod
+    def cache_policies(cls):
+        """Returns how long cached pages from this site stay fresh.
+
+        A list of (pattern, expire_after) pairs, as used by requests_cache's
+        urls_expire_after: patterns are regexes searched for in the URL, or
+        globs, and the first match wins. Unmatched URLs use the session default.
+        """
+        return []
+
     @classmethod
     def matches(cls, url):
         raise NotImplementedError()
@@ -183,35 +586,418 @@ class Site:
         """
         raise NotImplementedError()
 
+    def index(self, url):
+        """List a story's chapters, fetching as little as possible
+
+        By default this extracts the story with a chapter filter that drops
+        every chapter, so sites which use _filter_chapters only fetch their
+        index; the rest fetch the lot, which is cheap enough once it's cached.
+        Sites with a cheaper way to find their chapters should override it.
+
+        Args:
+            url (string): A valid URL for this Site
+        Returns:
+            StoryIndex
+        """
+        listed = []
+
+        def list_only(site, links):
+            listed.append(links)
+            return []
+
+        filters = self.chapter_filters
+        self.chapter_filters = [*filters, list_only]
+        try:
+            story = self.extract(url)
+        finally:
+            self.chapter_filters = filters
+        if listed:
+            chapters = listed[0]
+        else:
+            chapters = [ChapterLink(title=chapter.title, url=chapter.url, date=chapter.date) for chapter in story.everychapter()]
+        return StoryIndex(title=story.title, url=story.url, chapters=chapters)
+
+    async def aextract(self, url):
+        """Download a story from a given URL, as a coroutine
+
+        Sites which haven't been ported to AsyncSite run their synchronous
+        extract() in a worker thread, so every site can be driven from an
+        event loop.
+        """
+        return await asyncio.to_thread(self.extract, url)
+
+    async def aclose(self):
+        """Release anything held open by aextract()"""
+        pass
+
     def login(self, login_details):
         raise NotImplementedError()
 
-    def _soup(self, url, method=None, delay=0, retry=3, retry_delay=10, **kw) -> tuple[BeautifulSoup, str]:
+    def _throttle(self, url):
+        """Apply this site's configured rate limit to the host of `url`"""
+        if self.options.get('rate_limit'):
+            rate_limiter.configure(url, self.options['rate_limit'], self.options.get('rate_burst', 1))
+
+    def _retry_policy(self):
+        """The RetryPolicy for this site, built from its options"""
+        self._retry_budget.configure(self.options.get('retry_budget'))
+        return RetryPolicy(
+            attempts=self.options.get('retries', 3) + 1,
+            statuses=frozenset(self.options.get('retry_statuses') or self.retry_statuses),
+            backoff=self.options.get('retry_backoff', 2),
+        )
+
+    def _get(self, url, **kw) -> requests.Response:
+        """GET a URL through the session, retrying failures according to the
+        site's RetryPolicy. Raises a SiteException if it can't be fetched."""
+        policy = self._retry_policy()
+        for attempt in range(1, policy.attempts + 1):
+            started = time.monotonic()
+            page = error = None
+            try:
+                page = self.session.get(url, **kw)
+            except RETRYABLE_ERRORS as e:
+                error = e
+            wait = self._after_attempt(url, policy, attempt, time.monotonic() - started, page, error)
+            if wait is None:
+                return page
+            # doesn't hold up any other chapter fetches while it waits
+            host_limiter.get(url).sleep(wait)
+
+    def _after_attempt(self, url, policy, attempt, elapsed, page=None, error=None):
+        """Decide what happens after an attempt at fetching `url`
+
+        Returns None if `page` is good to use, or how many seconds to wait
+        before trying again; raises a SiteException if it's time to give up.
+        """
+        if page is not None and page:
+            logger.debug('Fetched %s in %.2fs (attempt %d, %s)', url, elapsed, attempt, getattr(page, 'from_cache', False) and 'cached' or 'uncached')
+            return None
+        if page is not None and page.status_code == 403 and page.headers.get('Server', False) == 'cloudflare' and "captcha-bypass" in page.text:
+            host_limiter.get(url).backoff()
+            raise CloudflareException("Couldn't fetch, probably because of Cloudflare protection", url)
+        problem = error if error is not None else page.status_code
+        if page is not None and page.status_code == 504 and page.reason == 'Not Cached':
+            # Working offline (only_if_cached), and it's not there; no point retrying
+            raise OfflineException("Not in the cache, and working offline", url)
+        if attempt >= policy.attempts or not policy.retryable(page, error):
+            logger.warning("Attempt %d/%d at %s failed after %.2fs (%s); giving up", attempt, policy.attempts, url, elapsed, problem)
+            raise SiteException("Couldn't fetch", url, problem)
+        if not self._retry_budget.spend():
+            logger.warning("Attempt %d/%d at %s failed after %.2fs (%s); out of retries for this story", attempt, policy.attempts, url, elapsed, problem)
+            raise SiteException("Couldn't fetch, and too many requests have failed to keep retrying", url, problem)
+        # A Retry-After will have paused the host for everyone; no point
+        # trying again before that's over.
+        wait = max(policy.delay(attempt), host_limiter.get(url).pause_remaining())
+        logger.warning("Attempt %d/%d at %s failed after %.2fs (%s); retrying in %.1fs", attempt, policy.attempts, url, elapsed, problem, wait)
+        return wait
+
+    def _parser(self):
+        """The parser for BeautifulSoup; lxml-native only changes how chapters
+        are cleaned, so pages it doesn't apply to are still parsed with lxml"""
+        parser = self.options.get('parser', 'lxml')
+        return 'lxml' if parser == NATIVE_PARSER else parser
+
+    def _native(self):
+        """Whether to parse and clean chapters with lxml itself"""
+        return self.native and self.options.get('parser') == NATIVE_PARSER
+
+    def _soup(self, url, method=None, regions=None, **kw) -> tuple[BeautifulSoup, str]:
+        """Parse a page, or some HTML; with `regions`, only the parts of it
+        those CSS selectors can match (see region_strainer)"""
         if not method:
-            method = self.options.get('parser', 'lxml')
+            method = self._parser()
         if url.startswith('http://') or url.startswith('https://'):
-            page = self.session.get(url, **kw)
-            if not page:
-                if page.status_code == 403 and page.headers.get('Server', False) == 'cloudflare' and "captcha-bypass" in page.text:
-                    raise CloudflareException("Couldn't fetch, probably because of Cloudflare protection", url)
-                if retry and retry > 0:
-                    real_delay = retry_delay
-                    if 'Retry-After' in page.headers:
-                        real_delay = int(page.headers['Retry-After'])
-                    logger.warning("Load failed: waiting %s to retry (%s: %s)", real_delay, page.status_code, page.url)
-                    time.sleep(real_delay)
-                    return self._soup(url, method=method, retry=retry - 1, retry_delay=retry_delay, **kw)
-                raise SiteException("Couldn't fetch", url)
-            if delay and delay > 0 and not page.from_cache:
-                time.sleep(delay)
-            logger.debug('Fetched %s, %s', url, page.from_cache and 'cached' or 'uncached')
-            text = page.text
+            self._throttle(url)
+            page = self._get(url, **kw)
+            return self._make_soup(page.content, method, regions, url, encoding=self._encoding(page))
+        return self._make_soup(url, method, regions, '')
+
+    def _make_soup(self, markup, method, regions, fallback_base, encoding=None):
+        # html5lib can't parse just part of a page
+        strainer = regions and method != 'html5lib' and region_strainer(regions) or None
+        # Given bytes, the parser decodes them itself, trying `encoding` first
+        soup = BeautifulSoup(markup, method, parse_only=strainer, from_encoding=encoding)
+        if strainer:
+            base = soup.find('base', recursive=False)
+        else:
+            base = soup.head and soup.head.base
+        return soup, str(base and base.get('href') or fallback_base)
+
+    def _encoding(self, page):
+        """How to decode a fetched page; see page_encoding"""
+        started = time.perf_counter()
+        encoding, source = page_encoding(page, self.options.get('encoding') or self.encoding)
+        logger.debug('Decoding %s as %s (from the %s), worked out in %.2fms', page.url, encoding, source, (time.perf_counter() - started) * 1000)
+        return encoding
+
+    def _chapter_soup(self, url, **kw) -> tuple[BeautifulSoup, str]:
+        """_soup for a chapter page, parsing only the site's `regions` of it"""
+        return self._soup(url, regions=self.regions, **kw)
+
+    def _tree(self, url, **kw) -> tuple[lxml.html.HtmlElement, str]:
+        """As _soup, but parsed by lxml into its own tree, for sites which
+        can clean their chapters natively (see `native`)"""
+        if url.startswith('http://') or url.startswith('https://'):
+            self._throttle(url)
+            page = self._get(url, **kw)
+            markup, encoding = page.content, self._encoding(page)
             fallback_base = url
         else:
-            text = url
+            # Encoded again so any encoding declaration in the page is moot
+            markup, encoding = url.encode('utf-8'), 'utf-8'
             fallback_base = ''
-        soup = BeautifulSoup(text, method)
-        return soup, str((soup.head and soup.head.base) and soup.head.base.get('href') or fallback_base)
+        try:
+            root = lxml.html.document_fromstring(markup, parser=lxml.html.HTMLParser(encoding=encoding))
+        except LookupError:
+            # An encoding Python knows but libxml2 doesn't
+            root = lxml.html.document_fromstring(markup.decode(encoding, 'replace').encode('utf-8'), parser=lxml.html.HTMLParser(encoding='utf-8'))
+        base = _BASE(root)
+        return root, str(base and base[0] or fallback_base)
+
+    def _page(self, url, **kw):
+        """A page of chapters: as a tree if they're to be cleaned natively,
+        and as a soup otherwise"""
+        if self._native():
+            return self._tree(url, **kw)
+        return self._soup(url, **kw)
+
+    def _filter_chapters(self, links):
+        """Narrow down the chapters listed in a story's index to the ones
+        which should actually be fetched, by applying `chapter_filters`.
+
+        Sites which can list their chapters before fetching them should
+        pass that list through here; sites which can't just ignore it.
+
+        Args:
+            links (list): ChapterLinks, in story order
+        Returns:
+            the ChapterLinks to fetch, still in story order
+        """
+        for chapter_filter in self.chapter_filters:
+            links = chapter_filter(self, links)
+        return links
+
+    def _extract_chapters(self, story, links, make, fetch=None):
+        """Fetch the chapters at `links` and add them to `story`, in order
+
+        With a `checkpoint`, chapters it already holds are restored rather
+        than fetched again, and every new chapter is saved to it as soon as
+        it's made. A chapter which can't be fetched or made then becomes a
+        placeholder (and goes in `checkpoint.failed`, for the next run to try
+        again) instead of abandoning the whole story; except when working
+        offline, where it couldn't turn up on the next run either.
+
+        Args:
+            story (Section): to add the chapters to
+            links (list): ChapterLinks, in story order
+            make (callable): called with a ChapterLink and whatever `fetch`
+                returned for its URL; returns the Chapter, or a list of them.
+                Or the name of a site method which does that, taking the
+                chapter id as well; those can be run in a process pool, with
+                the `processes` option (see _add_pooled_chapters).
+            fetch (callable): as for _fetch_all; defaults to `self._chapter_soup`
+        """
+        fetch = fetch or self._chapter_soup
+        saved = {link.url for link in links if self.checkpoint and link.url in self.checkpoint}
+        if isinstance(make, str) and self._processes() > 1:
+            pages = self._fetch_all([link.url for link in links if link.url not in saved], fetch=self._shipped_page, exceptions=bool(self.checkpoint))
+            jobs = ((link, None if link.url in saved else next(pages)) for link in links)
+            return self._add_pooled_chapters(story, jobs, make, fetch.__name__)
+        make = self._maker(story, make)
+        pages = self._fetch_all([link.url for link in links if link.url not in saved], fetch=fetch, exceptions=bool(self.checkpoint))
+        for link in links:
+            if link.url not in saved:
+                self._add_chapter(story, link, make, next(pages))
+            elif not self._restore_chapter(story, link):
+                self._add_chapter(story, link, make, self._fetch_one(fetch, link.url))
+
+    def _maker(self, story, make):
+        """`make` as _add_chapter takes it: as given, or the method it names
+        (see _extract_chapters), told the chapter id"""
+        if not isinstance(make, str):
+            return make
+        method = getattr(self, make)
+        return lambda link, page: method(link, page, len(story) + 1)
+
+    def _processes(self):
+        return max(self.options.get('processes') or 1, 1)
+
+    def _fetch_url(self, url):
+        """The URL a chapter's `fetch` actually gets for its link, if the
+        site tidies them up first"""
+        return url
+
+    def _shipped_page(self, url):
+        """Fetch the page for a chapter's link, unparsed, to ship to a pool worker"""
+        url = self._fetch_url(url)
+        page = self._get(url)
+        return ShippedPage(url=url, content=page.content, headers={'Content-Type': page.headers.get('Content-Type', '')})
+
+    def _add_pooled_chapters(self, story, jobs, make, fetch):
+        """Make chapters in a pool of `processes` worker processes, then add
+        them to the story in order, as _add_chapter would; see _make_in_worker
+
+        The workers number footnotes with placeholders, which are filled in
+        as each chapter's added, so the numbering's the same as if the
+        chapters had been made one after another here.
+
+        Args:
+            story (Section): to add the chapters to
+            jobs: (ChapterLink, page) in story order, where `page` is the
+                ShippedPage for the link, or the exception fetching it, or
+                None if the checkpoint should have the chapter
+            make (str): as for _extract_chapters
+            fetch (str): the name of the site method to get the link's page
+                with, as for _extract_chapters; it's given the shipped one
+        """
+        processes = self._processes()
+        placeholder = f'leech{uuid.uuid4().hex}'
+        pool = _process_pool(processes)
+        pending = deque()
+        try:
+            for link, page in jobs:
+                if isinstance(page, ShippedPage):
+                    page = pool.submit(_make_in_worker, type(self), self.options, placeholder, fetch, make, link, page)
+                pending.append((link, page))
+                if len(pending) > processes * 2:
+                    self._add_pooled_chapter(story, placeholder, make, fetch, *pending.popleft())
+            while pending:
+                self._add_pooled_chapter(story, placeholder, make, fetch, *pending.popleft())
+        finally:
+            # The pool's kept for the next story, but not this one's leftovers
+            for link, page in pending:
+                if isinstance(page, Future):
+                    page.cancel()
+
+    def _add_pooled_chapter(self, story, placeholder, make, fetch, link, page):
+        if page is None:
+            if not self._restore_chapter(story, link):
+                self._add_chapter(story, link, self._maker(story, make), self._fetch_one(getattr(self, fetch), link.url))
+            return
+        if isinstance(page, Future):
+            try:
+                page = page.result()
+            except Exception as e:
+                page = e
+        self._add_chapter(story, link, functools.partial(self._adopt_chapters, story, placeholder), page)
+
+    def _adopt_chapters(self, story, placeholder, link, made):
+        """Takes what _make_in_worker made for a link, with its footnotes
+        and chapters numbered as if they'd been made here"""
+        chapters, footnotes, finalized = made
+        first_footnote = self.footnote_offset + len(self.footnotes)
+        first_chapter = self.chapter_offset + len(story)
+
+        def renumber(text):
+            return re.sub(placeholder + r'([nc])(\d+)', lambda m: str((first_footnote if m.group(1) == 'n' else first_chapter) + int(m.group(2))), text)
+
+        self.footnotes.extend(renumber(footnote) for footnote in footnotes)
+        for chapter, done in zip(chapters, finalized):
+            chapter.contents = renumber(chapter.contents)
+            if done is not False:
+                # So finalizing takes the worker's version, not parsing it again
+                self._trees[chapter.contents] = done and (renumber(done[0]), done[1])
+        return chapters
+
+    def _restore_chapter(self, story, link):
+        """Add the chapter at `link` to the story from the checkpoint, if it's
+        there; returns whether it was"""
+        if not (self.checkpoint and link.url and link.url in self.checkpoint):
+            return False
+        saved = self.checkpoint.load(link.url)
+        # Saved with other footnote numbers, it'd have to be made again to fix them
+        if not saved or (saved['footnotes'] and saved['position'] != self._position(story)):
+            return False
+        for chapter in saved['chapters']:
+            story.add(Chapter(**chapter))
+        self.footnotes.extend(saved['footnotes'])
+        return True
+
+    def _add_chapter(self, story, link, make, page):
+        """Make the chapter at `link` from its `page` (whatever was fetched
+        for it, or the exception fetching it raised) and add it to the story,
+        saving it to the checkpoint or leaving a placeholder as for
+        _extract_chapters"""
+        position = self._position(story)
+        footnotes = len(self.footnotes)
+        try:
+            if isinstance(page, Exception):
+                raise page
+            chapters = make(link, page)
+        except Exception as e:
+            # Working offline, a missing chapter won't turn up on a rerun
+            if not self.checkpoint or isinstance(e, OfflineException):
+                raise
+            logger.error("Couldn't extract chapter \"%s\" (%s); leaving a placeholder for it", link.title, e)
+            del self.footnotes[footnotes:]
+            self.checkpoint.failed.append(link)
+            story.add(Chapter(
+                title=link.title,
+                contents=f'<p>This chapter couldn\'t be downloaded. <a href="{html.escape(link.url or "")}">It\'s online here.</a></p>',
+                date=link.date or None,
+                url=link.url
+            ))
+            return
+        chapters = chapters if isinstance(chapters, list) else [chapters]
+        for chapter in chapters:
+            story.add(chapter)
+        if self.checkpoint and link.url:
+            self.checkpoint.save(link.url, chapters, self.footnotes[footnotes:], position)
+
+    def _fetch_one(self, fetch, url):
+        try:
+            return fetch(url)
+        except Exception as e:
+            return e
+
+    def _position(self, story):
+        return [self.chapter_offset + len(story), self.footnote_offset + len(self.footnotes)]
+
+    def _fetch_all(self, urls, fetch=None, exceptions=False):
+        """Fetch a list of URLs on a bounded worker pool
+
+        Results are yielded in the same order as `urls`, so callers can
+        process chapters (and number their footnotes) exactly as they would
+        have serially. Only a few results are fetched ahead of the consumer,
+        to keep the number of parsed pages held in memory down.
+
+        Args:
+            urls (list): URLs to fetch
+            fetch (callable): called with each URL on a worker thread;
+                defaults to `self._soup`
+            exceptions (bool): if true, a URL which fails yields its
+                exception instead of raising it
+        Yields:
+            whatever `fetch` returned for each URL, in order
+        """
+        fetch = fetch or self._soup
+        if exceptions:
+            fetch = functools.partial(self._fetch_one, fetch)
+        for url in urls:
+            self._throttle(url)
+        concurrency = min(max(self.options.get('concurrency') or 1, 1), MAX_CONCURRENCY)
+        if concurrency == 1:
+            for url in urls:
+                yield fetch(url)
+            return
+
+        def worker(url):
+            with host_limiter.get(url, concurrency):
+                return fetch(url)
+
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='leech-fetch')
+        pending = deque()
+        try:
+            for url in urls:
+                pending.append(pool.submit(worker, url))
+                if len(pending) > concurrency * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # If the consumer bailed out early, don't go on to fetch the rest
+            pool.shutdown(wait=True, cancel_futures=True)
 
     def _soup_contents(self, soup, prettify=True):
         if soup.body:
@@ -219,12 +1005,32 @@ class Site:
         if prettify:
             # prettify includes the top-level tag, and stripping it is sort of
             # a pain; joining the prettified children should be enough.
-            return ''.join(
+            contents = ''.join(
                 child.prettify() if hasattr(child, 'prettify') else str(child)
                 for child in soup.children
             )
+            # Kept until the chapter's finalized: there's nothing to do then
+            # if it has no images, and if it does, the tree's taken out of
+            # the rest of the page, so that can be freed in the meantime
+            if '<img' in contents:
+                self._trees[contents] = soup.extract() if soup.parent else soup
+            else:
+                self._trees[contents] = None
+            return contents
         return soup.decode_contents()
 
+    def _tree_contents(self, element):
+        """The native counterpart to _soup_contents: the element's contents,
+        serialized as XHTML (if not prettily)"""
+        contents = ''.join(
+            [html.escape(element.text, quote=False) if element.text else ''] +
+            [etree.tostring(child, method='xml', encoding='unicode') for child in element]
+        )
+        # As for _soup_contents; copying the element is cheap here, and lets
+        # the rest of the page go
+        self._trees[contents] = copy.deepcopy(element) if '<img' in contents else None
+        return contents
+
     def _form_in_soup(self, soup):
         if soup.name == 'form':
             return soup
@@ -267,18 +1073,24 @@ class Site:
             # compatibility shim equalizing new_tag and find behaviors
             kw['class'] = kw['class_']
             del kw['class_']
-        soup = BeautifulSoup("", self.options.get('parser'))
-        return soup.new_tag(*args, **kw)
+        return _tag_factory(self._parser()).new_tag(*args, **kw)
 
     def _join_url(self, *args, **kwargs):
         return urlparse.urljoin(*args, **kwargs)
 
+    def _footnote_numbers(self, chapterid):
+        """The next footnote's number, and that of the chapter it's in; or
+        placeholders for them, in a pool worker (see _adopt_chapters)"""
+        if self._placeholder:
+            return f'{self._placeholder}n{len(self.footnotes) + 1}', f'{self._placeholder}c{chapterid}'
+        return self.footnote_offset + len(self.footnotes) + 1, self.chapter_offset + chapterid
+
     def _footnote(self, contents, chapterid):
         """Register a footnote and return a link to that footnote"""
 
         # TODO: This embeds knowledge of what the generated filenames will be. Work out a better way.
 
-        idx = len(self.footnotes) + 1
+        idx, chapter = self._footnote_numbers(chapterid)
 
         # epub spec footnotes are all about epub:type on the footnote and the link
         # http://www.idpf.org/accessibility/guidelines/content/semantics/epub-type.php
@@ -295,7 +1107,7 @@ class Site:
         # otherwise it doesn't get the inline-popup treatment
         # http://kindlegen.s3.amazonaws.com/AmazonKindlePublishingGuidelines.pdf
         # section 3.9.10
-        backlink = self._new_tag('a', href=f'chapter{chapterid}.html#noteback{idx}')
+        backlink = self._new_tag('a', href=f'chapter{chapter}.html#noteback{idx}')
         backlink.string = '^'
         contents.insert(0, backlink)
 
@@ -314,6 +1126,28 @@ class Site:
 
         return spoiler_link
 
+    def _footnote_tree(self, contents, chapterid):
+        """The native counterpart to _footnote, for an lxml element"""
+        idx, chapter = self._footnote_numbers(chapterid)
+
+        contents.tag = 'aside'
+        contents.set('id', f'footnote{idx}')
+        contents.set(f'{{{EPUB_NAMESPACE}}}type', 'footnote')
+
+        backlink = lxml.html.Element('a', href=f'chapter{chapter}.html#noteback{idx}')
+        backlink.text = '^'
+        # Ahead of any text, not just the first child
+        backlink.tail, contents.text = contents.text, None
+        contents.insert(0, backlink)
+
+        self.footnotes.append(etree.tostring(contents, method='xml', encoding='unicode', with_tail=False))
+
+        spoiler_link = lxml.html.Element('a', id=f'noteback{idx}', href=f'footnotes.html#footnote{idx}')
+        spoiler_link.set(f'{{{EPUB_NAMESPACE}}}type', 'noteref')
+        spoiler_link.text = str(idx)
+
+        return spoiler_link
+
     def _clean(self, contents, base:str|None=None):
         """Clean up story content to be more ebook-friendly
 
@@ -347,24 +1181,83 @@ class Site:
 
         return contents
 
-    def _finalize(self, story):
+    def _clean_tree(self, contents, base=None):
+        """The native counterpart to _clean, for an lxml element"""
+        for tag in _CF_EMAILS(contents):
+            enc = bytes.fromhex(tag.get('data-cfemail'))
+            email = bytes([c ^ enc[0] for c in enc[1:]]).decode('utf8')
+            parent = tag.getparent()
+            if parent is not None and parent.tag == 'a' and (parent.get('href') or '').startswith('/cdn-cgi/l/email-protection'):
+                tag = parent
+            replace_tree_with_text(tag, email)
+        if self.options['strip_colors']:
+            for tag in _STYLED(contents):
+                tag.set('style', re.sub(r'(?:color|background)\s*:[^;]+;?', '', tag.get('style')))
+        if base:
+            for img in _IMAGES_WITH_SRC(contents):
+                img.set('src', self._join_url(base, img.get('src')))
+                img.attrib.pop('srcset', None)
+                img.attrib.pop('sizes', None)
+
+        return contents
+
+    def _finalize(self, story, manifest=None):
         # Call this on a story after it's fully extracted to clean up things
-        for chapter in story:
+        toplevel = manifest is None and self.manifests is not None
+        if toplevel:
+            manifest = self.manifests.open(story)
+        for index, chapter in enumerate(story):
             if hasattr(chapter, '__iter__'):
-                self._finalize(chapter)
+                self._finalize(chapter, manifest)
+            elif manifest is not None:
+                self._finalize_chapter(story, index, chapter, manifest)
             else:
                 self._process_images(chapter)
+        self._trees.clear()
+        if toplevel:
+            manifest.save()
 
         if self.footnotes:
             story.footnotes = Chapter('Footnotes', '\n\n'.join(self.footnotes))
             self.footnotes = []
             self._process_images(story.footnotes)
 
+    def _finalize_chapter(self, story, index, chapter, manifest):
+        # Reuse what this chapter finalized to last time, if it hasn't changed
+        key = manifest.chapter_key(story, index, chapter)
+        digest = content_hash(chapter.contents)
+        image_fetch = bool(self.options.get('image_fetch'))
+        finalized = manifest.finalized(key, digest, image_fetch)
+        if finalized:
+            chapter.contents, urls = finalized
+            chapter.images = {url: Image(url) for url in urls}
+            manifest.record(key, chapter, digest, image_fetch)
+        else:
+            self._process_images(chapter)
+            manifest.record(key, chapter, digest, image_fetch, contents=chapter.contents)
+
     def _process_images(self, chapter):
-        soup, base = self._soup(chapter.contents)
+        # Contents the site has just serialized still have their tree about;
+        # anything else (restored, concatenated, from an API) gets parsed
+        if chapter.contents in self._trees:
+            soup = self._trees.pop(chapter.contents)
+            if soup is None:
+                return
+            if isinstance(soup, tuple):
+                # Already done in a pool worker
+                chapter.contents, urls = soup
+                chapter.images.update((url, Image(url)) for url in urls if url not in chapter.images)
+                return
+            if is_tree(soup):
+                return self._process_tree_images(chapter, soup)
+            changed = False
+        else:
+            soup, base = self._soup(chapter.contents)
+            changed = True
 
         if self.options.get('image_fetch'):
             for count, img in enumerate(soup.find_all('img', src=True)):
+                changed = True
                 # logger.info(f"Image in {chapter.title}: {img['src']}")
                 if img['src'] not in chapter.images:
                     chapter.images[img['src']] = Image(img['src'])
@@ -373,6 +1266,7 @@ class Site:
         else:
             # Remove all images from the chapter so you don't get that annoying grey background.
             for img in soup.find_all('img'):
+                changed = True
                 # Note: alt="" will be completely removed here, which is consitent with the semantics
                 if img.parent.name.lower() == "figure":
                     # TODO: figcaption?
@@ -380,7 +1274,199 @@ class Site:
                 else:
                     img.replace_with(img.get('alt', '🖼'))
 
-        chapter.contents = self._soup_contents(soup)
+        if changed:
+            chapter.contents = self._soup_contents(soup)
+            self._trees.pop(chapter.contents, None)
+
+    def _process_tree_images(self, chapter, element):
+        # As _process_images, for chapters cleaned natively
+        if self.options.get('image_fetch'):
+            for img in _IMAGES_WITH_SRC(element):
+                chapter.images.setdefault(img.get('src'), Image(img.get('src')))
+                img.set('src', chapter.images[img.get('src')].path())
+        else:
+            for img in _IMAGES(element):
+                if img.getparent().tag == 'figure':
+                    replace_tree_with_text(img.getparent(), img.get('alt', '🖼'))
+                else:
+                    replace_tree_with_text(img, img.get('alt', '🖼'))
+        chapter.contents = self._tree_contents(element)
+        self._trees.pop(chapter.contents, None)
+
+
+@define
+class AsyncSite(Site):
+    """A Site whose extraction is written as coroutines.
+
+    Subclasses implement aextract() in terms of _asoup() / _aget() /
+    _afetch_all(), and get a synchronous extract() for free. Requests go
+    through a pooled httpx.AsyncClient when httpx is installed, so pending
+    chapter fetches are coroutines rather than threads; the requests_cache
+    session is still read from and written to, so cached runs stay cached.
+    """
+    _client: object = field(default=None, init=False)
+
+    def extract(self, url):
+        # Sync shim, so leech.open_story doesn't need to know about any of this
+        async def run():
+            try:
+                return await self.aextract(url)
+            finally:
+                await self.aclose()
+        return asyncio.run(run())
+
+    async def aextract(self, url):
+        raise NotImplementedError()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _async_client(self):
+        if self._client is None:
+            # No cookies here: the session's cookies are already in the headers
+            # of every request prepared by _aget.
+            self._client = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=httpx.Timeout(30, connect=6.01),
+                limits=httpx.Limits(max_connections=MAX_CONCURRENCY * 4, max_keepalive_connections=MAX_CONCURRENCY),
+            )
+        return self._client
+
+    async def _aget(self, url, **kw) -> requests.Response:
+        """The coroutine equivalent of `self._get(url)`
+
+        Always returns a requests.Response, so callers can treat the result
+        exactly as they would a response from the regular session.
+        """
+        policy = self._retry_policy()
+        for attempt in range(1, policy.attempts + 1):
+            started = time.monotonic()
+            page = error = None
+            try:
+                page = await self._aget_once(url, **kw)
+            except RETRYABLE_ERRORS as e:
+                error = e
+            wait = self._after_attempt(url, policy, attempt, time.monotonic() - started, page, error)
+            if wait is None:
+                return page
+            await asyncio.sleep(wait)
+
+    async def _aget_once(self, url, **kw) -> requests.Response:
+        if httpx is None:
+            return await asyncio.to_thread(self.session.get, url, **kw)
+
+        prepared = self.session.prepare_request(requests.Request('GET', url, **kw))
+        cache = getattr(self.session, 'cache', None)
+        cached = actions = None
+        if cache is not None:
+            actions = CacheActions.from_request(cache.create_key(prepared), prepared, self.session.settings)
+            cached = await asyncio.to_thread(cache.get_response, actions.cache_key)
+            # adds If-None-Match / If-Modified-Since, if the expired response has validators
+            actions.update_from_cached_response(cached, cache.create_key)
+            if actions.error_504:
+                # A cache-only session (only_if_cached) with nothing usable cached
+                return get_504_response(prepared)
+            if cached is not None and not (actions.send_request or actions.resend_request):
+                return self._record_stats(cached)
+            actions.update_request(prepared)
+
+        self._throttle(url)
+        host = host_limiter.get(prepared.url)
+        wait = host.pause_remaining() + rate_limiter.reserve(prepared.url)
+        if wait:
+            await asyncio.sleep(wait)
+        result = await self._async_client().get(prepared.url, headers=dict(prepared.headers))
+
+        # httpx has already decompressed the body, so don't leave headers
+        # around which would make anything try that again.
+        headers = {k: v for k, v in result.headers.items() if k.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+        response = requests.Response()
+        response.status_code = result.status_code
+        response.reason = result.reason_phrase
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response.url = str(result.url)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.request = prepared
+        response._content = result.content
+        response.raw = urllib3.HTTPResponse(
+            body=b'', headers=headers, status=result.status_code, reason=result.reason_phrase,
+            request_url=response.url, preload_content=False
+        )
+
+        host.record(response)
+        if cache is not None:
+            response = await asyncio.to_thread(self._save_to_cache, response, actions, cached)
+        return self._record_stats(response)
+
+    def _save_to_cache(self, response, actions, cached=None):
+        # Lets requests_cache decide on expiry / cacheability, same as it would
+        # have for a response fetched through the session itself.
+        actions.update_from_response(response)
+        if cached is not None and response.status_code == 304:
+            cached = actions.update_revalidated_response(response, cached)
+            if not actions.skip_write:
+                self.session.cache.save_response(cached, actions.cache_key, actions.expires)
+            return cached
+        if not actions.skip_write:
+            self.session.cache.save_response(response, actions.cache_key, actions.expires)
+        return response
+
+    def _record_stats(self, response):
+        # What the session would have done, had it sent this itself
+        if stats := getattr(self.session, 'cache_stats', None):
+            stats.record(response)
+        return response
+
+    async def _asoup(self, url, method=None, regions=None, **kw) -> tuple[BeautifulSoup, str]:
+        if not method:
+            method = self._parser()
+        if not (url.startswith('http://') or url.startswith('https://')):
+            return self._soup(url, method=method, regions=regions)
+        page = await self._aget(url, **kw)
+        return self._make_soup(page.content, method, regions, url, encoding=self._encoding(page))
+
+    async def _achapter_soup(self, url, **kw) -> tuple[BeautifulSoup, str]:
+        return await self._asoup(url, regions=self.regions, **kw)
+
+    async def _afetch_all(self, urls, fetch=None, exceptions=False):
+        """Coroutine counterpart to Site._fetch_all
+
+        Every URL gets a coroutine straight away, but only as many as the
+        host's HostLimit allows are talking to the network at once.
+        Returns a list of results in the same order as `urls`; with
+        `exceptions`, a URL which fails gets its exception in the list.
+        """
+        fetch = fetch or self._asoup
+        concurrency = min(max(self.options.get('concurrency') or 1, 1), MAX_CONCURRENCY)
+
+        async def worker(url):
+            host = host_limiter.get(url, concurrency)
+            while not host.try_acquire():
+                await asyncio.sleep(host.pause_remaining() or 0.05)
+            try:
+                return await fetch(url)
+            finally:
+                host.release()
+
+        return await asyncio.gather(*(worker(url) for url in urls), return_exceptions=exceptions)
+
+    async def _aextract_chapters(self, story, links, make, fetch=None):
+        """Coroutine counterpart to Site._extract_chapters"""
+        fetch = fetch or self._achapter_soup
+        make = self._maker(story, make)
+        saved = {link.url for link in links if self.checkpoint and link.url in self.checkpoint}
+        pages = iter(await self._afetch_all([link.url for link in links if link.url not in saved], fetch=fetch, exceptions=bool(self.checkpoint)))
+        for link in links:
+            if link.url not in saved:
+                self._add_chapter(story, link, make, next(pages))
+            elif not self._restore_chapter(story, link):
+                try:
+                    page = await fetch(link.url)
+                except Exception as e:
+                    page = e
+                self._add_chapter(story, link, make, page)
 
 
 @define
@@ -420,6 +1506,308 @@ class SiteSpecificOption:
         )
 
 
+# When several processes build stories at once (leech's --jobs), how many of
+# them might be fetching from each host; see share_limits
+_limit_shares = {'hosts': {}, 'default': 1}
+
+
+def share_limits(hosts, default=1):
+    """Split every host's rate limit and concurrency between the processes
+    building stories at once, since each has limiters of its own.
+
+    Args:
+        hosts (dict): how many processes might be fetching from each host
+        default (int): the same, for any other host
+    """
+    _limit_shares.update(hosts=dict(hosts), default=default)
+
+
+def _limit_share(host):
+    return _limit_shares['hosts'].get(host, _limit_shares['default'])
+
+
+class HostLimit:
+    """An adaptive cap on how many requests may be in flight to one host.
+
+    This is an AIMD controller: every time a full window's worth of requests
+    succeeds the cap goes up by one (to at most `ceiling`), and whenever the
+    host pushes back (429 / 503, or Cloudflare) it's halved. A Retry-After
+    from the host pauses every worker, not just the one which received it.
+
+    Hold it as a context manager around a fetch.
+    """
+
+    def __init__(self, host, ceiling):
+        self.host = host
+        self.ceiling = ceiling
+        self.limit = 1
+        self.active = 0
+        self._successes = 0
+        self._paused_until = 0
+        self._cond = threading.Condition()
+        # how many slots the current thread holds, so sleep() can hand them back
+        self._held = threading.local()
+
+    def __enter__(self):
+        with self._cond:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self.active >= self.limit:
+                    self._cond.wait()
+                else:
+                    break
+            self.active += 1
+        self._held.count = getattr(self._held, 'count', 0) + 1
+        return self
+
+    def __exit__(self, *exc):
+        self._held.count -= 1
+        self.release()
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def sleep(self, seconds):
+        """Sleep, letting another worker have this thread's slot (if it has
+        one) in the meantime."""
+        held = getattr(self._held, 'count', 0)
+        if held:
+            self.__exit__()
+        try:
+            time.sleep(seconds)
+        finally:
+            if held:
+                self.__enter__()
+
+    def try_acquire(self):
+        """Non-blocking __enter__, for callers which can't block (i.e. coroutines)"""
+        with self._cond:
+            if self.pause_remaining() or self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def pause_remaining(self):
+        return max(0, self._paused_until - time.monotonic())
+
+    def wait_for_pause(self):
+        if pause := self.pause_remaining():
+            logger.debug("Waiting %.1fs for %s to accept requests again", pause, self.host)
+            time.sleep(pause)
+
+    def success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.ceiling:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def backoff(self, retry_after=None):
+        with self._cond:
+            limit = max(1, self.limit // 2)
+            if limit != self.limit:
+                logger.info("%s is pushing back; fetching %d at a time instead of %d", self.host, limit, self.limit)
+            self.limit = limit
+            self._successes = 0
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._cond.notify_all()
+
+    def record(self, response):
+        """Feed a (non-cached) response's status back into the controller"""
+        if response.status_code in (429, 503):
+            self.backoff(retry_after_seconds(response.headers))
+        elif response.status_code < 400:
+            self.success()
+
+
+class HostLimiter:
+    """The process-wide HostLimit for every host.
+
+    Being process-wide means several handlers (or several stories) fetching
+    from the same site share the one allowance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def get(self, url, ceiling=None):
+        """Returns the HostLimit to hold while fetching `url`
+
+        If `ceiling` is given it becomes the most the limit can grow to (or
+        this process's share of it; see share_limits)."""
+        host = urlparse.urlparse(url).netloc
+        share = _limit_share(host)
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostLimit(host, max(1, (ceiling or MAX_CONCURRENCY) // share))
+            elif ceiling:
+                self._hosts[host].ceiling = max(1, ceiling // share)
+            return self._hosts[host]
+
+
+host_limiter = HostLimiter()
+
+
+@define
+class RetryPolicy:
+    """Which failed requests get retried, how many times, and how long to
+    wait in between."""
+    # total tries, including the first
+    attempts: int = 4
+    # status codes, or classes of them like "5xx"
+    statuses: frozenset = frozenset((408, 425, 429, '5xx'))
+    # seconds before the first retry; doubles with each one after
+    backoff: float = 2
+    max_backoff: float = 120
+
+    def retryable(self, response=None, error=None):
+        if error is not None:
+            return isinstance(error, RETRYABLE_ERRORS)
+        return response.status_code in self.statuses or f'{response.status_code // 100}xx' in self.statuses
+
+    def delay(self, attempt):
+        """Exponential backoff, with half of it randomized so a batch of
+        workers which all failed together don't all retry together too."""
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryBudget:
+    """A cap on retries for a story; each Site has its own.
+
+    Once it's spent every failure is final, so a host which has gone down
+    fails the download quickly instead of each chapter waiting out its own
+    full set of retries.
+    """
+
+    def __init__(self, limit=None):
+        self._lock = threading.Lock()
+        self.limit = limit
+        self.spent = 0
+
+    def configure(self, limit):
+        if limit is not None:
+            self.limit = limit
+
+    def spend(self):
+        with self._lock:
+            if self.limit is not None and self.spent >= self.limit:
+                return False
+            self.spent += 1
+            return True
+
+
+def retry_after_seconds(headers):
+    """Interpret a Retry-After header, which is either seconds or an HTTP date"""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        # A -0000 zone; HTTP dates are in UTC anyway
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, and up to `burst` at once"""
+
+    def __init__(self, rate, burst=1):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def reserve(self):
+        """Take a token, returning how many seconds to wait before using it.
+
+        Tokens can be overdrawn, which queues callers up in the order they
+        asked rather than having them all race for the next refill."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0, -self._tokens / self.rate)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """Process-wide request rate limits, keyed by host.
+
+    Hosts which haven't been configured aren't limited at all.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def configure(self, url, rate, burst=1):
+        host = urlparse.urlparse(url).netloc
+        # Just this process's share, if others are fetching from it too
+        share = _limit_share(host)
+        rate, burst = rate / share, max(1, burst // share)
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                self._buckets[host] = TokenBucket(rate, burst)
+            elif (bucket.rate, bucket.burst) != (rate, burst):
+                with bucket._lock:
+                    bucket.rate, bucket.burst = rate, burst
+
+    def reserve(self, url):
+        bucket = self._buckets.get(urlparse.urlparse(url).netloc)
+        return bucket.reserve() if bucket else 0
+
+    def acquire(self, url):
+        wait = self.reserve(url)
+        if wait:
+            logger.debug("Rate limited: waiting %.2fs for %s", wait, url)
+            time.sleep(wait)
+        return wait
+
+
+rate_limiter = RateLimiter()
+
+
+class RateLimitedAdapter(requests.adapters.HTTPAdapter):
+    """Transport adapter which waits on `rate_limiter` before each request,
+    and reports how each response went to the host's HostLimit.
+
+    Mounted on the session by leech.create_session. Because requests_cache
+    only reaches the adapter on a cache miss, cached responses are never
+    held up by the limits (and don't count as the host being healthy).
+    """
+
+    def send(self, request, *args, **kwargs):
+        host = host_limiter.get(request.url)
+        host.wait_for_pause()
+        rate_limiter.acquire(request.url)
+        response = super().send(request, *args, **kwargs)
+        host.record(response)
+        return response
+
+
 class SiteException(Exception):
     pass
 
@@ -428,6 +1816,10 @@ class CloudflareException(SiteException):
     pass
 
 
+class OfflineException(SiteException):
+    pass
+
+
 def register(site_class):
     _sites.append(site_class)
     return site_class
@@ -442,6 +1834,16 @@ def get(url):
     raise NotImplementedError("Could not find a handler for " + url)
 
 
+def cache_policies():
+    """Returns every site's cache policies, for a CachedSession's urls_expire_after."""
+    policies = {}
+    for site_class in _sites:
+        for pattern, expire_after in site_class.cache_policies():
+            policies.setdefault(pattern, expire_after)
+    policies.setdefault(IMAGE_URL, CACHE_CHAPTER)
+    return policies
+
+
 def list_site_specific_options():
     """Returns a list of all site's click options, which will be presented to the user."""
 
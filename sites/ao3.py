@@ -4,14 +4,29 @@ import logging
 import datetime
 import re
 import requests_cache
-from . import register, Site, Section, Chapter, SiteException
+from lxml import etree
+from . import register, Site, Section, Chapter, ChapterLink, StoryIndex, SiteException, CACHE_INDEX, has_class, is_tree
 
 logger = logging.getLogger(__name__)
 
+_WORKSKIN = etree.XPath('//*[@id="workskin"]')
+_PREFACE = f'//*[@id="workskin"]//*[{has_class("preface")}]'
+_TITLE = etree.XPath(f'{_PREFACE}//*[{has_class("title")}]')
+_AUTHOR = etree.XPath(f'{_PREFACE}//*[{has_class("byline")}]//a')
+_SUMMARY = etree.XPath(f'{_PREFACE}//*[{has_class("summary")}]//blockquote')
+_TAGS = etree.XPath(f'//*[{has_class("work")}][{has_class("meta")}]//*[{has_class("tags")}]//a[{has_class("tag")}]')
+_CHAPTERS = etree.XPath('//*[@id="chapters"]/div')
+_ONLY_CHAPTER = etree.XPath('//*[@id="chapters"]/..')
+_ARTICLE = etree.XPath('.//div[@role="article"]')
+_LANDMARKS = etree.XPath(f'.//*[{has_class("landmark")}]')
+_END_NOTES = etree.XPath(f'.//*[{has_class("end")}][{has_class("notes")}][ancestor::*[@id="chapters"]]')
+
 
 @register
 class ArchiveOfOurOwn(Site):
     """Archive of Our Own: it has its own epub export, but the formatting is awful"""
+    native = True
+
     @staticmethod
     def matches(url):
         # e.g. http://archiveofourown.org/works/5683105/chapters/13092007
@@ -19,6 +34,14 @@ class ArchiveOfOurOwn(Site):
         if match:
             return match.group(1) + '/'
 
+    @staticmethod
+    def cache_policies():
+        # The full work holds every chapter, so it goes stale as soon as the
+        # chapter list from /navigate does; keep them in step.
+        return [
+            (re.compile(r'archiveofourown\.org/(?:works|series)/\d+'), CACHE_INDEX),
+        ]
+
     def login(self, login_details):
         with requests_cache.disabled():
             try:
@@ -45,12 +68,58 @@ class ArchiveOfOurOwn(Site):
         workid = re.match(r'^https?://(?:www\.)?archiveofourown\.org/works/(\d+)/?.*', url).group(1)
         return self._extract_work(workid)
 
+    def index(self, url):
+        # The chapter list is a page of its own, so there's no need for the full work
+        workid = re.match(r'^https?://(?:www\.)?archiveofourown\.org/works/(\d+)/?.*', url).group(1)
+        nav_soup, nav_base = self._soup(f'https://archiveofourown.org/works/{workid}/navigate')
+        heading = nav_soup.select_one('#main h2.heading a')
+        return StoryIndex(
+            title=heading.text.strip() if heading else '',
+            url=f'http://archiveofourown.org/works/{workid}',
+            chapters=self._chapter_links(nav_soup, nav_base)
+        )
+
     def _extract_work(self, workid):
         # Fetch the full work
         url = f'http://archiveofourown.org/works/{workid}?view_adult=true&view_full_work=true'
         logger.info("Extracting full work @ %s", url)
-        soup, base = self._soup(url)
+        soup, base = self._page(url)
+
+        if is_tree(soup):
+            story, chapters = self._work_from_tree(soup, workid)
+        else:
+            story, chapters = self._work_from_soup(soup, workid)
+
+        # Fetch the chapter list as well because it contains info that's not in the full work
+        nav_soup, nav_base = self._soup(f'https://archiveofourown.org/works/{workid}/navigate')
+
+        # The full work has every chapter in it regardless, so filtering
+        # them only saves on cleaning up the unwanted ones
+        links = self._chapter_links(nav_soup, nav_base)
+        wanted = {id(link) for link in self._filter_chapters(links)}
+        for index, link in enumerate(links):
+            if id(link) not in wanted:
+                continue
+            logger.info("Extracting chapter %s", link.title)
+
+            chapter_soup = chapters[index]
+            if chapter_soup is None:
+                logger.warning("Couldn't find chapter %s in full work", index + 1)
+                continue
+
+            story.add(Chapter(
+                title=link.title,
+                # the `or soup` fallback covers single-chapter works
+                contents=self._chapter(chapter_soup, base),
+                date=link.date,
+                url=link.url
+            ))
 
+        self._finalize(story)
+
+        return story
+
+    def _work_from_soup(self, soup, workid):
         if not soup.find(id='workskin'):
             raise SiteException("Can't find the story text; you may need to log in or flush the cache")
 
@@ -62,39 +131,49 @@ class ArchiveOfOurOwn(Site):
             tags=[tag.get_text().strip() for tag in soup.select('.work.meta .tags a.tag')]
         )
 
-        # Fetch the chapter list as well because it contains info that's not in the full work
-        nav_soup, nav_base = self._soup(f'https://archiveofourown.org/works/{workid}/navigate')
         chapters = soup.select('#chapters > div')
         if len(chapters) == 1:
             # in a single-chapter story the #chapters div is actually the chapter
             chapters = [soup.find(id='chapters').parent]
 
-        for index, chapter in enumerate(nav_soup.select('#main ol[role="navigation"] li')):
-            link = chapter.find('a')
-            logger.info("Extracting chapter %s", link.string)
+        return story, chapters
+
+    def _work_from_tree(self, root, workid):
+        # As _work_from_soup, for --parser lxml-native
+        if not _WORKSKIN(root):
+            raise SiteException("Can't find the story text; you may need to log in or flush the cache")
 
-            updated = datetime.datetime.strptime(
-                chapter.find('span', class_='datetime').string,
-                "(%Y-%m-%d)"
-            )
+        story = Section(
+            title=_TITLE(root)[0].text_content().strip(),
+            author=_AUTHOR(root)[0].text_content().strip(),
+            summary=etree.tostring(_SUMMARY(root)[0], method='xml', encoding='unicode', with_tail=False),
+            url=f'http://archiveofourown.org/works/{workid}',
+            tags=[tag.text_content().strip() for tag in _TAGS(root)]
+        )
 
-            chapter_soup = chapters[index]
-            if not chapter_soup:
-                logger.warning("Couldn't find chapter %s in full work", index + 1)
-                continue
+        chapters = _CHAPTERS(root)
+        if len(chapters) == 1:
+            chapters = _ONLY_CHAPTER(root)
 
-            story.add(Chapter(
+        return story, chapters
+
+    def _chapter_links(self, nav_soup, nav_base):
+        links = []
+        for chapter in nav_soup.select('#main ol[role="navigation"] li'):
+            link = chapter.find('a')
+            links.append(ChapterLink(
                 title=link.string,
-                # the `or soup` fallback covers single-chapter works
-                contents=self._chapter(chapter_soup, base),
-                date=updated
+                url=self._join_url(nav_base, link['href']),
+                date=datetime.datetime.strptime(
+                    chapter.find('span', class_='datetime').string,
+                    "(%Y-%m-%d)"
+                )
             ))
-
-        self._finalize(story)
-
-        return story
+        return links
 
     def _chapter(self, soup, base):
+        if is_tree(soup):
+            return self._chapter_tree(soup, base)
         content = soup.find('div', role='article')
 
         for landmark in content.find_all(class_='landmark'):
@@ -111,6 +190,26 @@ class ArchiveOfOurOwn(Site):
 
         return self._soup_contents(content) + (notes and self._soup_contents(notes) or '')
 
+    def _chapter_tree(self, chapter, base):
+        # As _chapter, for --parser lxml-native
+        content = _ARTICLE(chapter)[0]
+        notes = next(iter(_END_NOTES(chapter)), None)
+        for landmark in _LANDMARKS(content) + (_LANDMARKS(notes) if notes is not None else []):
+            landmark.drop_tree()
+
+        self._clean_tree(content, base)
+
+        if notes is not None:
+            # The notes' contents follow on in the same element, so the
+            # chapter's serialized (and its images seen to) all at once
+            if len(content):
+                content[-1].tail = (content[-1].tail or '') + (notes.text or '')
+            else:
+                content.text = (content.text or '') + (notes.text or '')
+            content.extend(notes)
+
+        return self._tree_contents(content)
+
 
 @register
 class ArchiveOfOurOwnSeries(ArchiveOfOurOwn):
@@ -142,3 +241,20 @@ class ArchiveOfOurOwnSeries(ArchiveOfOurOwn):
             story.add(substory)
 
         return story
+
+    def index(self, url):
+        # Every work's chapter list, one after another
+        seriesid = re.match(r'^https?://archiveofourown\.org/series/(\d+)/?.*', url).group(1)
+
+        soup, base = self._soup(f'http://archiveofourown.org/series/{seriesid}?view_adult=true')
+
+        chapters = []
+        for work in soup.select('#main ul.series li.work'):
+            workid = work.get('id').replace('work_', '')
+            chapters.extend(super().index(f'http://archiveofourown.org/works/{workid}').chapters)
+
+        return StoryIndex(
+            title=soup.select('#main h2.heading')[0].text.strip(),
+            url=f'http://archiveofourown.org/series/{seriesid}',
+            chapters=chapters
+        )
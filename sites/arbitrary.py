@@ -1,12 +1,13 @@
 #!/usr/bin/python
 
+import functools
 import logging
 from attrs import define
 import datetime
 import json
 import re
 import os.path
-from . import register, Site, Section, Chapter, SiteException
+from . import register, Site, Section, Chapter, ChapterLink, SiteException
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +41,8 @@ class SiteDefinition:
     next_selector: str|None = None
     # If present, use to filter out content that matches the selector
     filter_selector: str|None = None
+    # If present, only the parts of each page matching this are parsed; by default, those matching content_selector
+    regions: str|None = None
     cover_url: str = ''
 
 
@@ -64,15 +67,26 @@ class Arbitrary(Site):
             cover_url=definition.cover_url
         )
 
+        skipped = 0
         if definition.chapter_selector:
             soup, base = self._soup(definition.url)
+            chapter_links = []
             for chapter_link in soup.select(definition.chapter_selector):
                 chapter_url = str(chapter_link.get('href'))
                 if base:
                     chapter_url = self._join_url(base, chapter_url)
                 chapter_url = self._join_url(definition.url, chapter_url)
-                for chapter in self._chapter(chapter_url, definition, title=chapter_link.string):
-                    story.add(chapter)
+                chapter_links.append(ChapterLink(title=chapter_link.string, url=chapter_url))
+
+            wanted = self._filter_chapters(chapter_links)
+            skipped = len(chapter_links) - len(wanted)
+
+            def make(chapter_link, page):
+                chapter_soup, chapter_base = page
+                logger.info("Extracting chapter @ %s", chapter_link.url)
+                return self._chapter_from_soup(chapter_soup, chapter_base, definition, title=chapter_link.title)
+
+            self._extract_chapters(story, wanted, make, fetch=functools.partial(self._soup, regions=definition.regions or definition.content_selector))
         else:
             # set of already processed urls. Stored to detect loops.
             found_content_urls = set()
@@ -94,7 +108,7 @@ class Arbitrary(Site):
                 # reset url list
                 content_urls = []
                 if content_url and definition.next_selector:
-                    soup, base = self._soup(content_url)
+                    soup, base = self._soup(content_url, regions=definition.next_selector)
                     next_link = soup.select(definition.next_selector)
                     if next_link:
                         for next_link_item in next_link:
@@ -103,7 +117,7 @@ class Arbitrary(Site):
                                 next_link_url = self._join_url(base, next_link_url)
                             content_urls.append(self._join_url(content_url, next_link_url))
 
-        if not story:
+        if not story and not skipped:
             raise SiteException("No story content found; check the content selectors")
 
         self._finalize(story)
@@ -112,8 +126,10 @@ class Arbitrary(Site):
 
     def _chapter(self, url, definition, title=None):
         logger.info("Extracting chapter @ %s", url)
-        soup, base = self._soup(url)
+        soup, base = self._soup(url, regions=definition.regions or definition.content_selector)
+        return self._chapter_from_soup(soup, base, definition, title=title)
 
+    def _chapter_from_soup(self, soup, base, definition, title=None):
         chapters = []
 
         if not soup.select(definition.content_selector):
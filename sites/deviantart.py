@@ -39,12 +39,7 @@ class DeviantArt(Stash):
         thumbs = content.select(".stream a.thumb")
         if not thumbs:
             return
-        for thumb in thumbs:
-            try:
-                if thumb['href'] != '#':
-                    story.add(self._chapter(thumb['href']))
-            except Exception:
-                logger.exception("Couldn't extract chapters from thumbs")
+        self._add_thumbs(story, thumbs)
 
         self._finalize(story)
 
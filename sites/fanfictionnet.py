@@ -5,7 +5,7 @@ import datetime
 import re
 import urllib.parse
 import attr
-from . import register, Site, SiteException, CloudflareException, Section, Chapter
+from . import register, Site, SiteException, CloudflareException, Section, Chapter, ChapterLink, rate_limiter, CACHE_INDEX, CACHE_CHAPTER
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +13,7 @@ logger = logging.getLogger(__name__)
 @register
 class FanFictionNet(Site):
     _cloudflared = attr.ib(init=False, default=False)
+    regions = '#storytext'
 
     """FFN: it has a lot of stuff"""
     @staticmethod
@@ -22,6 +23,13 @@ class FanFictionNet(Site):
         if match:
             return 'https://www.fanfiction.net/s/' + match.group(1) + '/'
 
+    @staticmethod
+    def cache_policies():
+        return [
+            (re.compile(r'fanfiction\.net/s/\d+/\d+'), CACHE_CHAPTER),
+            (re.compile(r'fanfiction\.net/s/\d+'), CACHE_INDEX),
+        ]
+
     def extract(self, url):
         soup, base = self._soup(url)
 
@@ -60,14 +68,21 @@ class FanFictionNet(Site):
 
             # beautiful soup doesn't handle ffn's unclosed option tags at all well here
             options = re.findall(r'<option.+?value="?(\d+)"?[^>]*>([^<]+)', str(chapter_select))
-            for option in options:
-                story.add(Chapter(title=option[1], contents=self._chapter(base_url + option[0] + suffix), date=False))
+            chapters = [ChapterLink(title=option[1], url=base_url + option[0] + suffix, date=False) for option in options]
+            # only the first and last chapters have known dates
+            chapters[-1].date = updated
+            chapters[0].date = published
+
+            chapters = self._filter_chapters(chapters)
 
-            # fix up the dates
-            story[-1].date = updated
-            story[0].date = published
+            def make(chapter, page):
+                chapter_soup, chapter_base = page
+                logger.info("Fetching chapter @ %s", chapter.url)
+                return Chapter(title=chapter.title, contents=self._chapter_from_soup(chapter_soup, chapter_base), date=chapter.date, url=chapter.url)
+
+            self._extract_chapters(story, chapters, make)
         else:
-            story.add(Chapter(title=story.title, contents=self._chapter(url), date=published))
+            story.add(Chapter(title=story.title, contents=self._chapter(url), date=published, url=url))
 
         self._finalize(story)
 
@@ -75,13 +90,11 @@ class FanFictionNet(Site):
 
     def _chapter(self, url):
         logger.info("Fetching chapter @ %s", url)
-        soup, base = self._soup(url)
+        soup, base = self._chapter_soup(url)
+        return self._chapter_from_soup(soup, base)
 
-        content = soup.find(id="content_wrapper_inner")
-        if not content:
-            raise SiteException("No chapter content")
-
-        text = content.find(id="storytext")
+    def _chapter_from_soup(self, soup, base):
+        text = soup.find(id="storytext")
         if not text:
             raise SiteException("No chapter content")
 
@@ -97,19 +110,29 @@ class FanFictionNet(Site):
 
         return self._soup_contents(text)
 
+    def _throttle(self, url):
+        # archive.org has a gentler limit of its own, set up in _soup, which
+        # this site's rate_limit mustn't replace
+        if urllib.parse.urlparse(url).netloc.endswith('archive.org'):
+            return
+        super()._throttle(url)
+
     def _soup(self, url, *args, **kwargs):
         if self._cloudflared:
             fallback = f"https://archive.org/wayback/available?url={urllib.parse.quote(url)}"
+            # be gentle with archive.org
+            rate_limiter.configure(fallback, 1)
             try:
                 response = self.session.get(fallback)
                 wayback = response.json()
                 closest = wayback['archived_snapshots']['closest']['url']
-                return super()._soup(closest, *args, delay=1, **kwargs)
+                rate_limiter.configure(closest, 1)
+                return super()._soup(closest, *args, **kwargs)
             except Exception:
                 self.session.cache.delete_url(fallback)
                 raise CloudflareException("Couldn't fetch, presumably because of Cloudflare protection, and falling back to archive.org failed; if some chapters were succeeding, try again?", url, fallback)
         try:
-            return super()._soup(self, url, *args, **kwargs)
+            return super()._soup(url, *args, **kwargs)
         except CloudflareException:
             self._cloudflared = True
             return self._soup(url, *args, **kwargs)
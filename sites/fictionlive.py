@@ -4,7 +4,7 @@ import logging
 import itertools
 import datetime
 import re
-from . import register, Site, Section, Chapter
+from . import register, Site, Section, Chapter, CACHE_INDEX, CACHE_CHAPTER
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +19,14 @@ class FictionLive(Site):
         if match:
             return match.group(1)
 
+    @staticmethod
+    def cache_policies():
+        return [
+            # The last chapter's range is open-ended, so it picks up new posts
+            (re.compile(r'fiction\.live/api/anonkun/chapters/[^/]+/\d+/(?!9999999999999998)\d+'), CACHE_CHAPTER),
+            (re.compile(r'fiction\.live/api/'), CACHE_INDEX),
+        ]
+
     def extract(self, url):
         workid = re.match(r'^https?://fiction\.live/(?:stories|Sci-fi)/[^\/]+/([0-9a-zA-Z\-]+)/?.*', url).group(1)
 
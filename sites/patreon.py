@@ -3,7 +3,7 @@
 import logging
 import datetime
 import re
-from . import register, Site, Section, Chapter
+from . import register, Site, Section, Chapter, ChapterLink, StoryIndex
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +19,7 @@ class Patreon(Site):
         if match := re.match(r'^(https?://(?:www\.)?patreon\.com/([^/]+))/?.*', url):
             return match.group(0)
 
-    def extract(self, url):
+    def _campaign(self, url):
         response = self.session.get(url)
         # this is fragile:
         # "pageBootstrap":{"campaign":{"data":{"id":"2259814"
@@ -39,6 +39,30 @@ class Patreon(Site):
             tag_filter = match.group(1).replace('+', ' ')
             title = tag_filter
 
+        return params, title, author, tag_filter
+
+    def index(self, url):
+        # Just the first page of the newest posts: enough to see if there's anything new
+        params, title, author, tag_filter = self._campaign(url)
+        response = self.session.get('https://www.patreon.com/api/posts', params={**params, "sort": "-published_at"}).json()
+        return StoryIndex(
+            title=title,
+            url=url,
+            chapters=[
+                ChapterLink(
+                    title=post["attributes"]["title"],
+                    url=post["attributes"].get("url"),
+                    date=datetime.datetime.fromisoformat(post["attributes"]["published_at"])
+                )
+                for post in reversed(response["data"])
+                if "content" in post["attributes"] or "teaser_text" in post["attributes"]
+            ],
+            complete=not response.get("meta", {}).get("pagination", {}).get("cursors", {}).get("next")
+        )
+
+    def extract(self, url):
+        params, title, author, tag_filter = self._campaign(url)
+
         story = Section(
             title=title,
             author=author,
@@ -47,6 +71,7 @@ class Patreon(Site):
         )
 
         tags = set()
+        posts = []
 
         while params:
             # print("params", params)
@@ -70,12 +95,11 @@ class Patreon(Site):
                 else:
                     logger.warning("Skipped chapter, no content: %s", post["attributes"]["title"])
                     continue
-                story.add(Chapter(
+                posts.append((ChapterLink(
                     title=post["attributes"]["title"],
-                    contents=content,
-                    date=datetime.datetime.fromisoformat(post["attributes"]["published_at"]),
-                    # url=post["attributes"]["url"]
-                ))
+                    url=post["attributes"].get("url"),
+                    date=datetime.datetime.fromisoformat(post["attributes"]["published_at"])
+                ), content))
 
                 for tag in post.get("relationships", {}).get("user_defined_tags", {}).get("data", []):
                     tags.add(tag["id"].replace("user_defined;", ""))
@@ -86,6 +110,13 @@ class Patreon(Site):
             else:
                 params = False
 
+        # The posts come with their contents, so there's nothing to save on
+        # fetching, but the chapter filters still apply
+        wanted = {id(link) for link in self._filter_chapters([link for link, content in posts])}
+        for link, content in posts:
+            if id(link) in wanted:
+                story.add(Chapter(title=link.title, contents=content, date=link.date, url=link.url))
+
         story.tags = [tag for tag in tags if tag != tag_filter]
 
         self._finalize(story)
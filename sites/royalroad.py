@@ -4,7 +4,7 @@ import http.client
 import logging
 import datetime
 import re
-from . import register, Site, Section, Chapter, SiteSpecificOption
+from . import register, Site, Section, Chapter, ChapterLink, SiteSpecificOption, CACHE_INDEX, CACHE_CHAPTER
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +12,7 @@ logger = logging.getLogger(__name__)
 @register
 class RoyalRoad(Site):
     domain = r'royalroad'
+    regions = 'div.chapter-content, div.author-note-portlet, .profile-info, style'
 
     @staticmethod
     def get_site_specific_option_defs():
@@ -41,6 +42,13 @@ class RoyalRoad(Site):
         if match:
             return match.group(1) + '/'
 
+    @classmethod
+    def cache_policies(cls):
+        return [
+            (re.compile(r'%s\.com/fiction/\d+/[^/]+/chapter/' % cls.domain), CACHE_CHAPTER),
+            (re.compile(r'%s\.com/fiction/\d+' % cls.domain), CACHE_INDEX),
+        ]
+
     def extract(self, url):
         workid = re.match(r'^https?://(?:www\.)?%s\.com/fiction/(\d+)/?.*' % self.domain, url).group(1)
         soup, base = self._soup(f'https://www.{self.domain}.com/fiction/{workid}')
@@ -58,16 +66,22 @@ class RoyalRoad(Site):
             tags=[tag.get_text().strip() for tag in soup.select('span.tags a.fiction-tag')]
         )
 
+        chapters = []
         for index, chapter in enumerate(soup.select('#chapters tbody tr[data-url]')):
             if self.options['offset'] and index < self.options['offset']:
                 continue
             if self.options['limit'] and index >= self.options['limit']:
                 continue
-            chapter_url = str(self._join_url(story.url, str(chapter.get('data-url'))))
+            published = chapter.find('time', unixtime=True)
+            chapters.append(ChapterLink(
+                title=chapter.find('a', href=True).string.strip(),
+                url=str(self._join_url(story.url, str(chapter.get('data-url')))),
+                date=published and datetime.datetime.fromtimestamp(int(published['unixtime']))
+            ))
 
-            contents, updated = self._chapter(chapter_url, len(story) + 1)
+        chapters = self._filter_chapters(chapters)
 
-            story.add(Chapter(title=chapter.find('a', href=True).string.strip(), contents=contents, date=updated))
+        self._extract_chapters(story, chapters, '_make_chapter')
 
         http.client._MAXHEADERS = original_maxheaders
 
@@ -75,21 +89,25 @@ class RoyalRoad(Site):
 
         return story
 
-    def _chapter(self, url, chapterid):
-        logger.info("Extracting chapter @ %s", url)
-        soup, base = self._soup(url)
-        content = soup.find('div', class_='chapter-content')
+    def _make_chapter(self, chapter, page, chapterid):
+        chapter_soup, chapter_base = page
+        logger.info("Extracting chapter @ %s", chapter.url)
+        contents, updated = self._chapter(chapter_soup, chapter_base, chapterid)
+        return Chapter(title=chapter.title, contents=contents, date=updated, url=chapter.url)
+
+    def _chapter(self, soup, base, chapterid):
+        chapter = soup.find('div', class_='chapter-content')
 
-        self._clean(content, full_page=soup, base=base)
-        self._clean_spoilers(content, chapterid)
+        self._clean(chapter, full_page=soup, base=base)
+        self._clean_spoilers(chapter, chapterid)
 
-        content = str(content)
+        content = str(chapter)
 
         author_note = soup.find_all('div', class_='author-note-portlet')
 
         if len(author_note) == 1:
-            # Find the parent of chapter-content and check if the author's note is the first child div
-            if 'author-note-portlet' in soup.find('div', class_='chapter-content').parent.find('div')['class']:
+            # Check whether the author's note comes before the chapter
+            if chapter.find_previous('div', class_='author-note-portlet'):
                 content = str(author_note[0]) + '<hr/>' + content
             else:  # The author note must be after the chapter content
                 content = content + '<hr/>' + str(author_note[0])
@@ -33,21 +33,30 @@ class Stash(Site):
         thumbs = content.select(".stash-folder-stream .thumb")
         if not thumbs:
             return
-        for thumb in thumbs:
-            try:
-                if thumb['href'] != '#':
-                    story.add(self._chapter(thumb['href']))
-            except Exception:
-                logger.exception("Couldn't extract chapters from thumbs")
+        self._add_thumbs(story, thumbs)
 
         self._finalize(story)
 
         return story
 
-    def _chapter(self, url):
-        logger.info("Fetching chapter @ %s", url)
-        soup, base = self._soup(url)
+    def _add_thumbs(self, story, thumbs):
+        def fetch(url):
+            try:
+                return self._soup(url)
+            except Exception:
+                logger.exception("Couldn't fetch chapter from thumb @ %s", url)
+
+        chapter_urls = [thumb['href'] for thumb in thumbs if thumb.get('href', '#') != '#']
+        for chapter_url, page in zip(chapter_urls, self._fetch_all(chapter_urls, fetch=fetch)):
+            if not page:
+                continue
+            logger.info("Fetching chapter @ %s", chapter_url)
+            try:
+                story.add(self._chapter_from_soup(*page))
+            except Exception:
+                logger.exception("Couldn't extract chapters from thumbs")
 
+    def _chapter_from_soup(self, soup, base):
         content = soup.find(class_="journal-wrapper")
         if not content:
             raise SiteException("No content")
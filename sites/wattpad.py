@@ -3,13 +3,13 @@
 import logging
 import datetime
 import re
-from . import register, Site, Section, Chapter
+from . import register, AsyncSite, Section, Chapter, ChapterLink, CACHE_INDEX, CACHE_CHAPTER
 
 logger = logging.getLogger(__name__)
 
 
 @register
-class Wattpad(Site):
+class Wattpad(AsyncSite):
     """Wattpad"""
     @classmethod
     def matches(cls, url):
@@ -20,9 +20,16 @@ class Wattpad(Site):
             # the story-title part is unnecessary
             return match.group(1)
 
-    def extract(self, url):
+    @staticmethod
+    def cache_policies():
+        return [
+            (re.compile(r'wattpad\.com/apiv2/storytext'), CACHE_CHAPTER),
+            (re.compile(r'wattpad\.com/api/v3/stories/'), CACHE_INDEX),
+        ]
+
+    async def aextract(self, url):
         workid = re.match(r'^https?://(?:www\.)?wattpad\.com/story/(\d+)?.*', url).group(1)
-        info = self.session.get(f"https://www.wattpad.com/api/v3/stories/{workid}").json()
+        info = (await self._aget(f"https://www.wattpad.com/api/v3/stories/{workid}")).json()
 
         story = Section(
             title=info['title'],
@@ -31,19 +38,30 @@ class Wattpad(Site):
             cover_url=info['cover']
         )
 
-        for chapter in info['parts']:
-            story.add(Chapter(
+        chapters = self._filter_chapters([
+            ChapterLink(
                 title=chapter['title'],
-                contents=self._chapter(chapter['id']),
+                url=self._chapter_url(chapter['id']),
                 # "2020-05-03T22:14:29Z"
                 date=datetime.datetime.fromisoformat(chapter['createDate'].rstrip('Z'))  # modifyDate also?
-            ))
+            )
+            for chapter in info['parts']
+        ])
+        logger.info("Extracting %d chapters", len(chapters))
+
+        def make(chapter, api):
+            return Chapter(
+                title=chapter.title,
+                contents='<div>' + api.text + '</div>',
+                date=chapter.date,
+                url=chapter.url
+            )
+
+        await self._aextract_chapters(story, chapters, make, fetch=self._aget)
 
         self._finalize(story)
 
         return story
 
-    def _chapter(self, chapterid):
-        logger.info(f"Extracting chapter @ {chapterid}")
-        api = self.session.get(f"https://www.wattpad.com/apiv2/storytext?id={chapterid}")
-        return '<div>' + api.text + '</div>'
+    def _chapter_url(self, chapterid):
+        return f"https://www.wattpad.com/apiv2/storytext?id={chapterid}"
@@ -1,15 +1,24 @@
 #!/usr/bin/python
 
 import datetime
+import html
 import re
 import logging
 import requests_cache
+from lxml import etree
 
-from . import Site, SiteException, SiteSpecificOption, Section, Chapter
+from . import Site, SiteException, SiteSpecificOption, Section, Chapter, ChapterLink, ShippedPage, CACHE_INDEX, CACHE_CHAPTER, has_class, is_tree, wrap_tree
 import mintotp
 
 logger = logging.getLogger(__name__)
 
+_NEXT_PAGE = etree.XPath('//link[@rel="next"]/@href')
+_STYLED = etree.XPath('.//*[@style]')
+_EXPANDERS = etree.XPath(f'.//*[{has_class("quoteExpand")} or {has_class("bbCodeBlock-expandLink")} or {has_class("bbCodeBlock-shrinkLink")}]')
+_NOSCRIPT = etree.XPath('.//noscript')
+_LAZY_IMAGES = etree.XPath(f'.//img[{has_class("lazyload")}][@data-src]')
+_TALLIES = etree.XPath(f'.//div[{has_class("tally-block")}]')
+
 
 class XenForo(Site):
     """XenForo is forum software that powers a number of fiction-related forums."""
@@ -62,6 +71,17 @@ class XenForo(Site):
         if match:
             return match.group(1) + '/'
 
+    @classmethod
+    def cache_policies(cls):
+        if not cls.domain:
+            return []
+        domain = re.escape(cls.domain)
+        return [
+            (re.compile(r'%s/(?:index\.php\?)?posts/\d+' % domain), CACHE_CHAPTER),
+            # Thread pages, their reader mode and threadmarks all list chapters
+            (re.compile(r'%s/(?:index\.php\?)?threads/' % domain), CACHE_INDEX),
+        ]
+
     def siteurl(self, path):
         if self.index_urls:
             return f'https://{self.domain}/index.php?{path}'
@@ -120,37 +140,26 @@ class XenForo(Site):
 
         if reader_url:
             match = re.search(r'\d+/(\d+)/reader', reader_url)
-            if match:
-                cat = int(match.group(1))
-                if cat != 1 and cat in threadmark_categories:
-                    story.title = f'{story.title} ({threadmark_categories[cat]})'
-            idx = 0
-            while reader_url:
-                reader_url = self._join_url(base, reader_url)
-                logger.info("Fetching chapters @ %s", reader_url)
-                reader_soup, reader_base = self._soup(reader_url)
-                posts = self._posts_from_page(reader_soup)
-
-                for post in posts:
-                    idx = idx + 1
-                    if self.options['offset'] and idx < self.options['offset']:
-                        continue
-                    if self.options['limit'] and idx >= self.options['limit']:
-                        continue
-                    title = self._threadmark_title(post)
-                    if not self._chapter_title_allowed(title):
-                        continue
-                    logger.info("Extracting chapter \"%s\"", title)
-
-                    story.add(Chapter(
-                        title=title,
-                        contents=self._clean_chapter(post, len(story) + 1, base),
-                        date=self._post_date(post)
-                    ))
-
+            cat = match and int(match.group(1)) or 1
+            if cat != 1 and cat in threadmark_categories:
+                story.title = f'{story.title} ({threadmark_categories[cat]})'
+            elif cat == 1 and self.chapter_filters:
+                # Reader mode means fetching every page of chapters; when
+                # only some are wanted, fetching just those posts is cheaper
                 reader_url = False
-                if reader_soup.find('link', rel='next'):
-                    reader_url = reader_soup.find('link', rel='next').get('href')
+
+        if reader_url:
+            posts = self._reader_posts(reader_url, base)
+            if self._processes() > 1:
+                jobs = (
+                    (link, None if self.checkpoint and link.url in self.checkpoint else self._shipped_post(link, post, base))
+                    for link, post in posts
+                )
+                self._add_pooled_chapters(story, jobs, '_make_chapter', '_chapter_post')
+            else:
+                for link, post in posts:
+                    if not self._restore_chapter(story, link):
+                        self._add_chapter(story, link, self._maker(story, '_make_chapter'), (post, base))
         else:
             # TODO: Research whether reader mode is guaranteed to be enabled
             # when threadmarks are; if so, can delete this branch.
@@ -160,20 +169,58 @@ class XenForo(Site):
             ]
             marks = marks[self.options['offset']:self.options['limit']]
 
-            for idx, mark in enumerate(marks, 1):
-                href = self._join_url(base, mark.get('href'))
+            chapters = []
+            for mark in marks:
                 title = str(mark.string).strip()
                 if not self._chapter_title_allowed(title):
                     continue
-                logger.info("Fetching chapter \"%s\" @ %s", title, href)
-                contents, post_date = self._chapter(href, idx)
-                chapter = Chapter(title=title, contents=contents, date=post_date)
-                story.add(chapter)
+                chapters.append(ChapterLink(title=title, url=self._join_url(base, mark.get('href')), date=self._mark_date(mark)))
+
+            chapters = self._filter_chapters(chapters)
+
+            self._extract_chapters(story, chapters, '_make_chapter', fetch=self._chapter_post)
 
         self._finalize(story)
 
         return story
 
+    def _reader_posts(self, reader_url, base):
+        """The threadmarked posts on every page of reader mode, as (ChapterLink, post)"""
+        idx = 0
+        while reader_url:
+            reader_url = self._join_url(base, reader_url)
+            logger.info("Fetching chapters @ %s", reader_url)
+            reader_soup, reader_base = self._page(reader_url)
+            posts = self._posts_from_page(reader_soup)
+
+            for post in posts:
+                idx = idx + 1
+                if self.options['offset'] and idx < self.options['offset']:
+                    continue
+                if self.options['limit'] and idx >= self.options['limit']:
+                    continue
+                title = self._threadmark_title(post)
+                if not self._chapter_title_allowed(title):
+                    continue
+                yield ChapterLink(title=title, url=self._post_url(post)), post
+
+            reader_url = self._next_page(reader_soup)
+
+    def _shipped_post(self, link, post, base):
+        """A post from reader mode as a page of its own, to ship to a pool worker"""
+        markup = etree.tostring(post, method='html', encoding='unicode') if is_tree(post) else str(post)
+        return ShippedPage(
+            url=link.url,
+            content=f'<html><head><base href="{html.escape(base)}"></head><body>{markup}</body></html>'.encode('utf-8'),
+            headers={'Content-Type': 'text/html; charset=utf-8'}
+        )
+
+    def _make_chapter(self, chapter, page, chapterid):
+        post, post_base = page
+        logger.info("Extracting chapter \"%s\" @ %s", chapter.title, chapter.url)
+        contents, post_date = self._chapter(post, post_base, chapterid)
+        return Chapter(title=chapter.title, contents=contents, date=post_date, url=chapter.url)
+
     def _base_story(self, soup):
         url = soup.find('meta', property='og:url').get('content')
         title = soup.select('div.titleBar > h1')[0]
@@ -193,6 +240,17 @@ class XenForo(Site):
             return soup.find('li', id='post-' + postid)
         return soup.select('#messageList > li.hasThreadmark')
 
+    def _next_page(self, soup):
+        if is_tree(soup):
+            return next(iter(_NEXT_PAGE(soup)), False)
+        link = soup.find('link', rel='next')
+        return link and link.get('href') or False
+
+    def _post_url(self, post):
+        # For telling posts apart, e.g. in a checkpoint; both versions' ids end in the post number
+        match = re.search(r'(\d+)$', post.get('id') or '')
+        return match and self.siteurl(f'posts/{match.group(1)}/')
+
     def _threadmark_title(self, post):
         # Get the title, removing "<strong>Threadmark:</strong>" which precedes it
         return ''.join(post.select('div.threadmarker > span.label')[0].findAll(text=True, recursive=False)).strip()
@@ -245,8 +303,19 @@ class XenForo(Site):
 
         return marks
 
+    def _mark_date(self, mark):
+        # Threadmark lists show when each was posted; index posts don't
+        item = mark.find_parent('li')
+        if not item:
+            return None
+        if when := item.find('time', datetime=True):
+            return datetime.datetime.fromisoformat(when['datetime'])
+        if when := item.find(attrs={'data-time': True}):
+            return datetime.datetime.fromtimestamp(int(when['data-time']))
+        return None
+
     def _chapter_list_index(self, url):
-        post = self._post_from_url(url)
+        post, base = self._post_from_url(url)
         if not post:
             raise SiteException("Unparseable post URL", url)
 
@@ -261,35 +330,47 @@ class XenForo(Site):
 
         return links
 
-    def _chapter(self, url, chapterid):
-        post, base = self._post_from_url(url)
-
+    def _chapter(self, post, base, chapterid):
         return self._clean_chapter(post, chapterid, base), self._post_date(post)
 
-    def _post_from_url(self, url):
-        # URLs refer to specific posts, so get just that one
-        # if no specific post referred to, get the first one
+    def _chapter_post(self, url):
+        return self._post_from_url(url, native=self._native())
+
+    def _post_id(self, url):
         match = re.search(r'posts/(\d+)/?', url)
         if not match:
             match = re.match(r'.+#post-(\d+)$', url)
             # could still be nothing here
-        postid = match and match.group(1)
-        if postid:
+        return match and match.group(1)
+
+    def _fetch_url(self, url):
+        if postid := self._post_id(url):
             # create a proper post-url, because threadmarks can sometimes
             # mess up page-wise with anchors
-            url = self.siteurl(f'posts/{postid}/')
-        soup, base = self._soup(url)
+            return self.siteurl(f'posts/{postid}/')
+        return url
+
+    def _post_from_url(self, url, native=False):
+        # URLs refer to specific posts, so get just that one
+        # if no specific post referred to, get the first one
+        postid = self._post_id(url)
+        url = self._fetch_url(url)
+        soup, base = self._tree(url) if native else self._soup(url)
 
         if postid:
             return self._posts_from_page(soup, postid), base
 
         # just the first one in the thread, then
+        if native:
+            return next(iter(self._posts_from_page(soup)), None), base
         return soup.find('li', class_='message'), base
 
     def _chapter_contents(self, post):
         return post.find('blockquote', class_='messageText')
 
     def _clean_chapter(self, post, chapterid, base):
+        if is_tree(post):
+            return self._clean_chapter_tree(post, chapterid, base)
         post = self._chapter_contents(post)
         post.name = 'div'
         # mostly, we want to remove colors because the Kindle is terrible at them
@@ -329,6 +410,36 @@ class XenForo(Site):
         self._clean_spoilers(post, chapterid)
         return self._soup_contents(post)
 
+    def _clean_chapter_tree(self, post, chapterid, base):
+        # As _clean_chapter, for --parser lxml-native
+        post = self._chapter_contents(post)
+        post.tag = 'div'
+        for tag in _STYLED(post):
+            style = tag.get('style')
+            if style == 'color: transparent' and tag.text_content() == 'TAB':
+                tag.drop_tree()
+                continue
+            if "font-family: 'Courier New'" in style:
+                wrap_tree(tag, 'code')
+                style = re.sub(r"font-family: 'Courier New';?", '', style)
+            if "text-decoration: strikethrough" in style:
+                wrap_tree(tag, 'strike')
+                style = re.sub(r'text-decoration: strikethrough;?', '', style)
+            tag.set('style', style)
+        for tag in _EXPANDERS(post) + _NOSCRIPT(post):
+            tag.drop_tree()
+        for tag in _LAZY_IMAGES(post):
+            src = tag.get('data-url') or tag.get('data-src')
+            if src.startswith('proxy.php'):
+                src = f"{self.domain}/{src}"
+            tag.set('src', src)
+        if not self.options['include_tallies']:
+            for tag in _TALLIES(post):
+                tag.drop_tree()
+        self._clean_tree(post, base)
+        self._clean_spoilers(post, chapterid)
+        return self._tree_contents(post)
+
     def _clean_spoilers(self, post, chapterid):
         # spoilers don't work well, so turn them into epub footnotes
         for spoiler in post.find_all(class_='ToggleTriggerAnchor'):
@@ -2,14 +2,27 @@
 
 import datetime
 import logging
+import lxml.html
+from lxml import etree
 
-from . import register, Section, SiteException
+from . import register, Section, SiteException, has_class, is_tree, replace_tree
 from .xenforo import XenForo, XenForoIndex
 
 logger = logging.getLogger(__name__)
 
+_POSTS = etree.XPath(f'//article[{has_class("message--post")}]')
+_POST = etree.XPath('//article[@id = $id]')
+_THREADMARK_LABEL = etree.XPath(f'.//span[{has_class("threadmarkLabel")}]')
+_CONTENTS = etree.XPath(f'.//div[{has_class("message-userContent")}]')
+_SPOILERS = etree.XPath(f'.//*[{has_class("bbCodeSpoiler")}]')
+_SPOILER_TITLE = etree.XPath(f'.//*[{has_class("bbCodeSpoiler-button-title")}]')
+_SPOILER_CONTENTS = etree.XPath(f'.//*[{has_class("bbCodeBlock-content")}]')
+_TIME = etree.XPath('.//time[@datetime]/@datetime')
+
 
 class XenForo2(XenForo):
+    native = True
+
     def _base_story(self, soup):
         url = soup.find('meta', property='og:url').get('content')
         title = soup.select('h1.p-title-value')[0]
@@ -25,18 +38,28 @@ class XenForo2(XenForo):
         )
 
     def _posts_from_page(self, soup, postid=None):
+        if is_tree(soup):
+            if postid:
+                return next(iter(_POST(soup, id='js-post-' + postid)), None)
+            return _POSTS(soup)
         if postid:
             return soup.find('article', id='js-post-' + postid)
         return soup.select('article.message--post')
 
     def _threadmark_title(self, post):
         # Get the title, removing "<strong>Threadmark:</strong>" which precedes it
+        if is_tree(post):
+            return _THREADMARK_LABEL(post)[0].text_content()
         return post.find('span', class_='threadmarkLabel').get_text()
 
     def _chapter_contents(self, post):
+        if is_tree(post):
+            return next(iter(_CONTENTS(post)), None)
         return post.find('div', class_='message-userContent')
 
     def _clean_spoilers(self, post, chapterid):
+        if is_tree(post):
+            return self._clean_spoilers_tree(post, chapterid)
         # spoilers don't work well, so turn them into epub footnotes
         for spoiler in post.find_all(class_='bbCodeSpoiler'):
             spoiler_title = spoiler.find(class_='bbCodeSpoiler-button-title')
@@ -55,7 +78,34 @@ class XenForo2(XenForo):
                 new_spoiler.append(link)
             spoiler.replace_with(new_spoiler)
 
+    def _clean_spoilers_tree(self, post, chapterid):
+        # As _clean_spoilers, for --parser lxml-native
+        for spoiler in _SPOILERS(post):
+            spoiler_title = next((title.text_content() for title in _SPOILER_TITLE(spoiler)), None)
+            spoiler_contents = next(iter(_SPOILER_CONTENTS(spoiler)), None)
+            if spoiler_contents is None:
+                continue
+            spoiler_contents.getparent().remove(spoiler_contents)
+            spoiler_contents.tail = None
+            new_spoiler = lxml.html.Element('div', {'class': 'leech-spoiler'})
+            if self.options['spoilers'] == 'skip':
+                new_spoiler.text = spoiler_title and f'[SPOILER: {spoiler_title}]' or '[SPOILER]'
+            elif self.options['spoilers'] == 'inline':
+                if spoiler_title:
+                    new_spoiler.text = f"{spoiler_title}: "
+                new_spoiler.append(spoiler_contents)
+            else:
+                link = self._footnote_tree(spoiler_contents, chapterid)
+                if spoiler_title:
+                    link.text = spoiler_title
+                new_spoiler.append(link)
+            replace_tree(spoiler, new_spoiler)
+
     def _post_date(self, post):
+        if is_tree(post):
+            if when := _TIME(post):
+                return datetime.datetime.fromisoformat(when[0])
+            raise SiteException("No date")
         if post.find('time'):
             return datetime.datetime.fromisoformat(post.find('time').get('datetime'))
         raise SiteException("No date")
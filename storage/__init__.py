@@ -0,0 +1,10 @@
+from .cache import LRUSQLiteCache, LRUFileCache, CacheStats, StatsCachedSession, compressed_serializer
+from .checkpoint import Checkpoint, CheckpointStore
+from .library import Library, LibraryEntry
+from .manifest import Manifest, ManifestStore
+from .watchlist import WatchList, WatchedStory
+
+__all__ = [
+    'LRUSQLiteCache', 'LRUFileCache', 'CacheStats', 'StatsCachedSession', 'compressed_serializer',
+    'Checkpoint', 'CheckpointStore', 'Library', 'LibraryEntry', 'Manifest', 'ManifestStore', 'WatchList', 'WatchedStory',
+]
@@ -0,0 +1,289 @@
+#!/usr/bin/python
+
+"""
+The HTTP cache leech keeps between runs.
+
+requests_cache doesn't track when a response was last read, only when it
+expires, so this keeps a small side table of last-used times alongside its
+responses. That's what lets the cache be held to a maximum size by throwing
+away whatever hasn't been used for longest.
+
+Expired responses are kept rather than purged: requests_cache revalidates
+them with If-None-Match / If-Modified-Since when they're next requested, and
+reuses the cached body if the server says it hasn't changed.
+
+Responses are stored compressed, which matters for mostly-text pages: a big
+forum thread's HTML shrinks by about a factor of five.
+"""
+
+import gzip
+import logging
+import pickle
+import sys
+import threading
+import time
+import requests_cache
+from requests_cache.backends.filesystem import FileCache
+from requests_cache.backends.sqlite import SQLiteCache
+from requests_cache.serializers import SerializerPipeline, Stage
+from requests_cache.serializers.preconf import base_stage
+
+try:
+    # Optional: compresses better and faster than gzip. `pip install leech[zstd]`
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def _compress(compression):
+    if compression == 'zstd':
+        return lambda data: zstandard.compress(data, 3)
+    if compression == 'gzip':
+        return lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+    return lambda data: data
+
+
+def _decompress(data):
+    # Decided by what's actually stored rather than the current setting, so
+    # changing cache_compression doesn't throw away everything cached so far
+    data = bytes(data)
+    if data.startswith(ZSTD_MAGIC):
+        return zstandard.decompress(data)
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    return data
+
+
+def compressed_serializer(compression=None):
+    """requests_cache's pickle serializer, with its output compressed.
+
+    `compression` is "zstd", "gzip" or "none"; by default zstd is used if
+    zstandard is installed, and gzip otherwise.
+    """
+    if compression is None:
+        compression = 'zstd' if zstandard is not None else 'gzip'
+    if compression not in ('zstd', 'gzip', 'none'):
+        raise ValueError(f"Unknown cache compression: {compression}")
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError("zstd cache compression needs the zstandard package")
+    return SerializerPipeline(
+        [base_stage, Stage(pickle), Stage(dumps=_compress(compression), loads=_decompress)],
+        name=f'pickle-{compression}',
+        is_binary=True,
+    )
+
+
+class LRUSQLiteCache(SQLiteCache):
+    """requests_cache's SQLite backend, held to `max_size` bytes by evicting
+    the least recently used responses in prune()."""
+
+    # Last-used times are batched up in memory and written this many at a time
+    touch_batch = 100
+
+    def __init__(self, db_path, max_size=None, **kwargs):
+        # WAL lets readers carry on while a response is being written, and
+        # with a busy timeout several leech processes can share the cache
+        kwargs.setdefault('wal', True)
+        kwargs.setdefault('busy_timeout', 30_000)
+        super().__init__(db_path, **kwargs)
+        self.max_size = max_size
+        self._touched = {}
+        self._touch_lock = threading.Lock()
+        with self.responses.connection(commit=True) as con:
+            con.execute('CREATE TABLE IF NOT EXISTS leech_lru (key TEXT PRIMARY KEY, used REAL)')
+
+    def get_response(self, key, default=None):
+        response = super().get_response(key, default)
+        if response is not default:
+            self._touch(key)
+        return response
+
+    def save_response(self, response, cache_key=None, expires=None):
+        cache_key = cache_key or self.create_key(response.request)
+        super().save_response(response, cache_key, expires)
+        self._touch(cache_key)
+
+    def clear(self):
+        super().clear()
+        with self._touch_lock:
+            self._touched = {}
+        with self.responses.connection(commit=True) as con:
+            con.execute('DELETE FROM leech_lru')
+
+    def close(self):
+        self._flush_touches()
+        super().close()
+
+    def _touch(self, key):
+        with self._touch_lock:
+            self._touched[key] = time.time()
+            full = len(self._touched) >= self.touch_batch
+        if full:
+            self._flush_touches()
+
+    def _flush_touches(self):
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            with self.responses.connection(commit=True) as con:
+                con.executemany('INSERT OR REPLACE INTO leech_lru (key, used) VALUES (?, ?)', touched.items())
+
+    def stats(self):
+        """Returns a dict describing what's in the cache"""
+        self._flush_touches()
+        with self.responses.connection() as con:
+            entries, size = con.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM responses').fetchone()
+            expired, = con.execute('SELECT COUNT(*) FROM responses WHERE expires <= ?', (round(time.time()),)).fetchone()
+            oldest, newest = con.execute(
+                'SELECT MIN(used), MAX(used) FROM leech_lru WHERE key IN (SELECT key FROM responses)'
+            ).fetchone()
+        return {
+            'path': str(self.db_path),
+            'entries': entries,
+            'expired': expired,
+            'size': size,
+            'file_size': self.responses.size(),
+            'max_size': self.max_size,
+            'oldest_use': oldest,
+            'newest_use': newest,
+        }
+
+    def prune(self, max_size=None):
+        """Evict least recently used responses until the cache fits in
+        `max_size` bytes (defaulting to the size it was created with).
+
+        Responses which have never been recorded as used go first. Returns
+        a tuple of how many responses were evicted and how many bytes that
+        freed.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        if max_size is None:
+            return 0, 0
+        self._flush_touches()
+        with self.responses.connection() as con:
+            total, = con.execute('SELECT COALESCE(SUM(LENGTH(value)), 0) FROM responses').fetchone()
+            if total <= max_size:
+                return 0, 0
+            rows = con.execute(
+                'SELECT responses.key, LENGTH(responses.value) FROM responses'
+                ' LEFT JOIN leech_lru ON leech_lru.key = responses.key'
+                ' ORDER BY COALESCE(leech_lru.used, 0) ASC'
+            ).fetchall()
+        evict = []
+        freed = 0
+        for key, size in rows:
+            if total - freed <= max_size:
+                break
+            evict.append(key)
+            freed += size
+        logger.info("Evicting %d responses (%d bytes) from the cache", len(evict), freed)
+        self.responses.bulk_delete(evict)
+        self._prune_redirects()
+        self.responses.vacuum()
+        with self.responses.connection(commit=True) as con:
+            con.execute('DELETE FROM leech_lru WHERE key NOT IN (SELECT key FROM responses)')
+        return len(evict), freed
+
+
+class LRUFileCache(FileCache):
+    """requests_cache's filesystem backend, one file per response, held to
+    `max_size` bytes.
+
+    Its LRU index evicts the least recently used responses as new ones are
+    written, and prune() does the same on demand.
+    """
+
+    def __init__(self, cache_dir, max_size=None, **kwargs):
+        kwargs.setdefault('extension', 'dat')
+        super().__init__(cache_dir, max_cache_bytes=max_size or sys.maxsize, **kwargs)
+        self.max_size = max_size
+
+    @property
+    def db_path(self):
+        return self.cache_dir
+
+    def stats(self):
+        """Returns a dict describing what's in the cache"""
+        lru = self.responses.lru_index
+        with lru.connection() as con:
+            entries, oldest, newest = con.execute(
+                f'SELECT COUNT(*), MIN(access_time), MAX(access_time) FROM {lru.table_name}'
+            ).fetchone()
+        return {
+            'path': str(self.cache_dir),
+            'entries': entries,
+            # This means reading every response, but it's only for `leech cache stats`
+            'expired': sum(1 for _ in self.filter(valid=False, expired=True)),
+            'size': lru.total_size(),
+            'file_size': sum(path.stat().st_size for path in self.cache_dir.iterdir() if path.is_file()),
+            'max_size': self.max_size,
+            # LRUDict keeps nanoseconds
+            'oldest_use': oldest and oldest / 1e9,
+            'newest_use': newest and newest / 1e9,
+        }
+
+    def prune(self, max_size=None):
+        """Evict least recently used responses until the cache fits in
+        `max_size` bytes (defaulting to the size it was created with).
+
+        Returns a tuple of how many responses were evicted and how many bytes
+        that freed.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        if max_size is None:
+            return 0, 0
+        lru = self.responses.lru_index
+        excess = lru.total_size() - max_size
+        if excess <= 0:
+            return 0, 0
+        evict = lru.get_lru(excess)
+        freed = sum(lru.get(key, 0) for key in evict)
+        logger.info("Evicting %d responses (%d bytes) from the cache", len(evict), freed)
+        self.responses.bulk_delete(evict)
+        self._prune_redirects()
+        return len(evict), freed
+
+
+class CacheStats:
+    """Counts how responses were satisfied.
+
+    A response can come straight from the cache, be revalidated (the server
+    answered a conditional request with a 304, so the cached body was
+    reused rather than downloaded again), or be downloaded in full.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.downloaded = 0
+        self.saved_bytes = 0
+
+    def record(self, response):
+        with self._lock:
+            if getattr(response, 'revalidated', False):
+                self.revalidated += 1
+                self.saved_bytes += len(response.content or b'')
+            elif getattr(response, 'from_cache', False):
+                self.hits += 1
+            else:
+                self.downloaded += 1
+        return response
+
+
+class StatsCachedSession(requests_cache.CachedSession):
+    """A CachedSession which keeps CacheStats on everything it sends"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_stats = CacheStats()
+
+    def send(self, request, **kwargs):
+        return self.cache_stats.record(super().send(request, **kwargs))
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+
+"""
+Chapters saved as they're extracted, so a download which dies partway can
+pick up where it left off.
+
+Each story being downloaded gets a directory, named for a hash of its URL,
+with a small JSON file per chapter written as soon as that chapter has been
+fetched and cleaned. A later run with --resume restores those rather than
+doing them again; the directory is cleared once a book is built with every
+chapter present.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+class Checkpoint:
+    """The chapters saved so far for one story, kept in `directory`"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        # The ChapterLinks which couldn't be extracted this time round
+        self.failed = []
+
+    def __contains__(self, url):
+        return (self.directory / f'{_hash(url)}.json').exists()
+
+    def save(self, url, chapters, footnotes, position):
+        """Save the chapters made from a page, along with the footnotes they
+        added and where they came in the story (chapter number, footnote
+        number), which the footnote links in their contents depend on"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = {
+            'chapters': [{
+                'title': chapter.title,
+                'contents': chapter.contents,
+                'date': chapter.date.isoformat() if isinstance(chapter.date, datetime.datetime) else chapter.date,
+                'url': chapter.url,
+            } for chapter in chapters],
+            'footnotes': footnotes,
+            'position': position,
+        }
+        path = self.directory / f'{_hash(url)}.json'
+        # Written alongside and then swapped in, so it's never half-written
+        with open(path.with_suffix('.tmp'), 'w') as checkpoint_file:
+            json.dump(data, checkpoint_file)
+        os.replace(path.with_suffix('.tmp'), path)
+
+    def load(self, url):
+        """Returns the saved chapters' fields, footnotes and position, or None"""
+        try:
+            with open(self.directory / f'{_hash(url)}.json') as checkpoint_file:
+                data = json.load(checkpoint_file)
+        except (OSError, ValueError):
+            return None
+        for chapter in data['chapters']:
+            if isinstance(chapter['date'], str):
+                chapter['date'] = datetime.datetime.fromisoformat(chapter['date'])
+        return data
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class CheckpointStore:
+    """Where every story's checkpoint lives: a directory per story URL"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def open(self, url, resume=False):
+        """The checkpoint for the story at `url`. Unless resuming, anything
+        left over from an earlier run is thrown away first."""
+        checkpoint = Checkpoint(self.directory / _hash(url))
+        if not resume:
+            checkpoint.clear()
+        elif checkpoint.directory.exists():
+            logger.info("Resuming from %d saved chapters", len(list(checkpoint.directory.glob('*.json'))))
+        return checkpoint
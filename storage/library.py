@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+"""
+A catalog of the ebooks leech has built, for `leech library`.
+
+Each story gets a row, keyed by its URL: where its ebook was written, the
+chapters that went into it, and the options it was built with. That's
+enough for `library refresh` to fetch just each story's index, spot the
+ones which have moved on since, and rebuild those the same way as before.
+"""
+
+import contextlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from attrs import define, field, astuple
+
+_COLUMNS = ('url', 'site', 'title', 'filename', 'chapters', 'latest', 'options', 'built')
+
+
+@define
+class LibraryEntry:
+    url: str
+    site: str
+    title: str
+    filename: str
+    # The chapter titles in the ebook, to spot new ones against
+    chapters: list = field(factory=list)
+    # When the newest of them was posted, as an ISO date
+    latest: str | None = None
+    # What build_story was given: site_options, normalize, user_agent, other_flags
+    options: dict = field(factory=dict)
+    built: float = field(factory=time.time)
+
+
+class Library:
+    """The catalog, kept as an SQLite database at `path`. A connection is
+    opened for each operation, so it can be shared between threads, and
+    several processes can record builds in it at once."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as con:
+            con.execute(
+                'CREATE TABLE IF NOT EXISTS stories ('
+                'url TEXT PRIMARY KEY, site TEXT, title TEXT, filename TEXT, '
+                'chapters TEXT, latest TEXT, options TEXT, built REAL)'
+            )
+
+    @contextlib.contextmanager
+    def _connection(self):
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def __iter__(self):
+        with self._connection() as con:
+            rows = con.execute(f'SELECT {", ".join(_COLUMNS)} FROM stories ORDER BY title COLLATE NOCASE').fetchall()
+        return iter([self._entry(row) for row in rows])
+
+    def __len__(self):
+        with self._connection() as con:
+            return con.execute('SELECT COUNT(*) FROM stories').fetchone()[0]
+
+    def get(self, url):
+        with self._connection() as con:
+            row = con.execute(f'SELECT {", ".join(_COLUMNS)} FROM stories WHERE url = ?', (url,)).fetchone()
+        return row and self._entry(row)
+
+    def record(self, entry):
+        row = list(astuple(entry, recurse=False))
+        row[4], row[6] = json.dumps(entry.chapters), json.dumps(entry.options)
+        with self._connection() as con:
+            con.execute(f'INSERT OR REPLACE INTO stories ({", ".join(_COLUMNS)}) VALUES ({", ".join("?" * len(_COLUMNS))})', row)
+
+    def remove(self, url):
+        with self._connection() as con:
+            return con.execute('DELETE FROM stories WHERE url = ?', (url,)).rowcount > 0
+
+    @staticmethod
+    def _entry(row):
+        row = list(row)
+        row[4], row[6] = json.loads(row[4]), json.loads(row[6])
+        return LibraryEntry(*row)
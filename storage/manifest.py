@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+"""
+What went into the last ebook built for each story.
+
+Every story gets a small JSON manifest listing its chapters (URL, title,
+date, a hash of the contents and the images they use) and the images. That
+makes it cheap to tell which chapters have changed since the last build,
+which is most of what rebuilding an ongoing serial needs to know.
+
+Alongside the manifest are the outputs which are slow to make again: the
+finalized contents of each chapter, filed by content hash, and the images
+after conversion. A chapter whose hash hasn't changed is reused rather than
+processed again, and likewise an image converted with the same options.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from attrs import define, field, asdict
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(contents):
+    return hashlib.sha256(contents.encode('utf-8')).hexdigest()
+
+
+@define
+class ManifestChapter:
+    title: str
+    hash: str
+    url: str | None = None
+    date: str | None = None
+    # The settings the chapter was finalized with, which have to match to reuse it
+    image_fetch: bool = False
+    images: list = field(factory=list)
+
+
+@define
+class ManifestImage:
+    url: str
+    filetype: str
+    # The conversion settings, which have to match to reuse it
+    options: str = ''
+
+
+class Manifest:
+    """The manifest for one story, kept in `directory`"""
+
+    def __init__(self, directory, url=None, title=None):
+        self.directory = Path(directory)
+        self.path = self.directory / 'manifest.json'
+        self.url = url
+        self.title = title
+        self.chapters = {}
+        self.images = {}
+        # Chapters whose contents differ from the last build
+        self.changed = []
+        if self.path.exists():
+            with open(self.path) as manifest_file:
+                data = json.load(manifest_file)
+            self.chapters = {key: ManifestChapter(**chapter) for key, chapter in data.get('chapters', {}).items()}
+            self.images = {path: ManifestImage(**image) for path, image in data.get('images', {}).items()}
+
+    @staticmethod
+    def chapter_key(section, index, chapter):
+        """What a chapter is filed under: its URL, or where it is in the story"""
+        return chapter.url or f'{section.id}/{index}: {chapter.title}'
+
+    def finalized(self, key, digest, image_fetch):
+        """Returns the finalized contents and image URLs saved for a chapter,
+        if its contents hash to `digest` and it was finalized the same way"""
+        recorded = self.chapters.get(key)
+        if not recorded or recorded.hash != digest or recorded.image_fetch != image_fetch:
+            return None
+        try:
+            contents = (self.directory / 'chapters' / f'{digest}.html').read_text(encoding='utf-8')
+        except OSError:
+            return None
+        return contents, [self.images[path].url for path in recorded.images if path in self.images]
+
+    def record(self, key, chapter, digest, image_fetch, contents=None):
+        """Record a chapter, and save what it finalized to (`contents`) for next time"""
+        previous = self.chapters.get(key)
+        if previous and previous.hash != digest:
+            logger.info("Chapter has changed since the last build: %s", chapter.title)
+            self.changed.append(key)
+        if contents is not None:
+            (self.directory / 'chapters').mkdir(parents=True, exist_ok=True)
+            (self.directory / 'chapters' / f'{digest}.html').write_text(contents, encoding='utf-8')
+        self.chapters[key] = ManifestChapter(
+            title=chapter.title,
+            hash=digest,
+            url=chapter.url,
+            date=chapter.date.isoformat() if isinstance(chapter.date, datetime.datetime) else None,
+            image_fetch=image_fetch,
+            images=[image.path() for image in chapter.images.values()],
+        )
+        for image in chapter.images.values():
+            self.images.setdefault(image.path(), ManifestImage(url=image.url, filetype=''))
+        if previous and previous.hash != digest:
+            self._discard(previous.hash)
+
+    def image(self, path, options):
+        """Returns the converted image data and mimetype saved for an image
+        path, if it was converted with the same `options`"""
+        recorded = self.images.get(path)
+        if not recorded or recorded.options != options:
+            return None
+        try:
+            return (self.directory / path).read_bytes(), recorded.filetype
+        except OSError:
+            return None
+
+    def record_image(self, path, url, data, filetype, options):
+        (self.directory / path).parent.mkdir(parents=True, exist_ok=True)
+        (self.directory / path).write_bytes(data)
+        self.images[path] = ManifestImage(url=url, filetype=filetype, options=options)
+
+    def _discard(self, digest):
+        if not any(chapter.hash == digest for chapter in self.chapters.values()):
+            try:
+                os.remove(self.directory / 'chapters' / f'{digest}.html')
+            except OSError:
+                pass
+
+    def save(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = {
+            'url': self.url,
+            'title': self.title,
+            'chapters': {key: asdict(chapter) for key, chapter in self.chapters.items()},
+            'images': {path: asdict(image) for path, image in self.images.items()},
+        }
+        # Written alongside and then swapped in, so it's never half-written
+        with open(self.path.with_suffix('.tmp'), 'w') as manifest_file:
+            json.dump(data, manifest_file, indent=1)
+        os.replace(self.path.with_suffix('.tmp'), self.path)
+
+
+class ManifestStore:
+    """Where every story's manifest lives: a directory per story, by its id"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def open(self, story):
+        return Manifest(self.directory / story.id, url=story.url, title=story.title)
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+
+"""
+The stories `leech watch` follows, and when each is next due a look.
+
+Every story is polled on its own schedule: a story that's just updated is
+checked again after MIN_INTERVAL, and each check that finds nothing new
+doubles the wait, up to MAX_INTERVAL. So a serial that updates daily gets
+looked at a few times a day, and one abandoned years ago about once a week.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from attrs import define, field, asdict
+
+MIN_INTERVAL = 3600
+MAX_INTERVAL = 7 * 24 * 3600
+
+
+@define
+class WatchedStory:
+    url: str
+    output_dir: str | None = None
+    # The chapter titles seen last time, to spot new ones against
+    chapters: list = field(factory=list)
+    # The ebook last built for it
+    filename: str | None = None
+    interval: float = MIN_INTERVAL
+    next_check: float = 0
+    last_change: float | None = None
+
+    def due(self, now=None):
+        return self.next_check <= (now or time.time())
+
+    def checked(self, changed, now=None):
+        """Schedule the next check: soon if it changed, later if it didn't"""
+        now = now or time.time()
+        if changed:
+            self.interval = MIN_INTERVAL
+            self.last_change = now
+        else:
+            self.interval = min(self.interval * 2, MAX_INTERVAL)
+        self.next_check = now + self.interval
+
+
+class WatchList:
+    """The followed stories, kept as a JSON file at `path`"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.stories = {}
+        if self.path.exists():
+            with open(self.path) as watch_file:
+                self.stories = {story['url']: WatchedStory(**story) for story in json.load(watch_file)}
+
+    def __iter__(self):
+        return iter(self.stories.values())
+
+    def __len__(self):
+        return len(self.stories)
+
+    def add(self, url, output_dir=None):
+        story = self.stories.setdefault(url, WatchedStory(url))
+        story.output_dir = output_dir
+        return story
+
+    def remove(self, url):
+        return self.stories.pop(url, None)
+
+    def due(self, now=None):
+        return [story for story in self if story.due(now)]
+
+    def next_check(self):
+        return min((story.next_check for story in self), default=None)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Written alongside and then swapped in, so it's never half-written
+        with open(self.path.with_suffix('.tmp'), 'w') as watch_file:
+            json.dump([asdict(story) for story in self], watch_file, indent=1)
+        os.replace(self.path.with_suffix('.tmp'), self.path)
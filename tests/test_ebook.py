@@ -0,0 +1,45 @@
+import datetime
+import zipfile
+
+import pytest
+import requests
+
+import ebook
+from sites import Chapter, Section
+
+
+class FailingSession(requests.Session):
+    """A session whose every request fails, as if offline with nothing cached"""
+
+    def __init__(self, error=None):
+        super().__init__()
+        self.error = error
+
+    def get(self, url, **kwargs):
+        if self.error:
+            raise self.error
+        response = requests.Response()
+        response.status_code = 404
+        response.reason = 'Not Found'
+        response.url = url
+        return response
+
+
+@pytest.fixture
+def story():
+    story = Section(title='Test Story', author='Someone', url='https://example.com/story')
+    story.add(Chapter(title='Chapter 1', contents='<p>Once upon a time</p>', date=datetime.datetime(2024, 1, 1)))
+    return story
+
+
+@pytest.mark.parametrize('error', [None, requests.ConnectionError("no network")])
+def test_generate_epub_without_stylesheet(story, tmp_path, error):
+    filename = ebook.generate_epub(
+        story,
+        image_options={'image_fetch': False},
+        output_dir=tmp_path,
+        session=FailingSession(error),
+    )
+    with zipfile.ZipFile(filename) as epub:
+        assert epub.read('OEBPS/Styles/base.css')
+        assert b'Once upon a time' in epub.read(next(name for name in epub.namelist() if name.endswith('chapter1.html')))